@@ -1,6 +1,32 @@
+import threading
 import numpy as np
 import librosa
-from scipy.signal import butter, lfilter
+from contextlib import nullcontext
+from scipy.signal import butter, sosfilt
+
+# Scratch arrays reused across requests handled by the same worker thread.
+# Larger arrays are allocated per call, so each thread keeps at most
+# WORK_BUFFER_MAX_BYTES per buffer after a long recording.
+_buffers = threading.local()
+WORK_BUFFER_MAX_BYTES = 4 * 1024 * 1024
+
+def _no_timer(stage):
+    return nullcontext()
+
+def _work_buffer(name, shape, dtype):
+    """Returns a per-thread scratch array of `shape`, reallocated only when it needs to grow."""
+    size = int(np.prod(shape))
+    if size * np.dtype(dtype).itemsize > WORK_BUFFER_MAX_BYTES:
+        return np.empty(shape, dtype=dtype)
+    buffer = getattr(_buffers, name, None)
+    if buffer is None or buffer.dtype != dtype or buffer.size < size:
+        buffer = np.empty(size, dtype=dtype)
+        setattr(_buffers, name, buffer)
+    return buffer[:size].reshape(shape)
+
+def _energy(x):
+    """Sum of squares without materializing x ** 2, accumulated in float64 even for float32 input."""
+    return float(np.einsum('i,i->', x, x, dtype=np.float64))
 
 def analyze_audio_quality(y, sr):
     """
@@ -12,19 +38,20 @@ def analyze_audio_quality(y, sr):
 
     # 1. Clipping Detection
     clipping_threshold = 0.98
-    clipped_samples = np.sum(np.abs(y) >= clipping_threshold)
+    magnitude = np.abs(y, out=_work_buffer('magnitude', y.shape, y.dtype))
+    clipped_samples = np.count_nonzero(magnitude >= clipping_threshold)
     if (clipped_samples / len(y)) > 0.01:
         warnings.append('Audio is too loud (clipping detected). Please move away from the microphone.')
         quality_score -= 40
 
     # 2. Low Volume Detection
-    max_amplitude = np.max(np.abs(y))
+    max_amplitude = float(magnitude.max())
     if max_amplitude < 0.01:
         warnings.append('Audio is too quiet. Please speak closer to the microphone.')
         quality_score -= 40
 
     # 3. Signal-to-Noise Ratio (SNR) Estimation
-    snr = calculate_snr(y, sr)
+    snr, snr_measured = _estimate_snr(y, sr)
     if snr < 15:
         warnings.append(f'High background noise detected (SNR: {snr:.1f} dB). Please find a quieter room.')
         quality_score -= (15 - snr) * 2 # Penalize more for lower SNR
@@ -32,6 +59,7 @@ def analyze_audio_quality(y, sr):
     return {
         'quality_score': max(0, int(quality_score)),
         'snr': round(snr, 1),
+        'snr_measured': snr_measured,  # False when a default was used (e.g. no pauses to measure noise in)
         'amplitude': round(max_amplitude, 2),
         'warnings': warnings
     }
@@ -40,73 +68,167 @@ def calculate_snr(y, sr):
     """
     Estimates the Signal-to-Noise Ratio (SNR) of an audio signal.
     """
+    return _estimate_snr(y, sr)[0]
+
+def _estimate_snr(y, sr):
+    """Returns (SNR in dB, whether it was measured rather than defaulted)."""
     try:
         # Use librosa's VAD to split into speech and noise segments
         speech_intervals = librosa.effects.split(y, top_db=20)
         
         if len(speech_intervals) == 0:
-            return 0  # No speech detected
+            return 0, False  # No speech detected
 
-        # Concatenate speech parts
-        speech_signal = np.concatenate([y[start:end] for start, end in speech_intervals])
-        
-        # Estimate noise as everything else
-        noise_mask = np.ones(len(y), dtype=bool)
-        for start, end in speech_intervals:
-            noise_mask[start:end] = False
-        noise_signal = y[noise_mask]
+        # Speech energy per segment; noise is everything else
+        speech_length = int(np.sum(speech_intervals[:, 1] - speech_intervals[:, 0]))
+        noise_length = len(y) - speech_length
 
-        if len(noise_signal) == 0 or len(speech_signal) == 0:
-            return 35  # Very clean signal, assign a high SNR
+        if noise_length == 0 or speech_length == 0:
+            return 35, False  # Very clean signal, assign a high SNR
 
-        # Calculate power
-        speech_power = np.sum(speech_signal ** 2) / len(speech_signal)
-        noise_power = np.sum(noise_signal ** 2) / len(noise_signal)
+        # Calculate power. Noise energy is summed over the gaps between speech
+        # segments: total minus speech would cancel catastrophically on clean audio
+        gap_starts = np.concatenate([[0], speech_intervals[:, 1]])
+        gap_ends = np.concatenate([speech_intervals[:, 0], [len(y)]])
+        speech_power = sum(_energy(y[start:end]) for start, end in speech_intervals) / speech_length
+        noise_power = sum(_energy(y[start:end]) for start, end in zip(gap_starts, gap_ends)) / noise_length
 
         if noise_power == 0:
-            return 35  # No noise, high SNR
+            return 35, True  # No noise, high SNR
 
         snr = 10 * np.log10(speech_power / noise_power)
-        return snr
+        return snr, True
     except Exception:
-        return 10 # Default to a moderate SNR on error
+        return 10, False # Default to a moderate SNR on error
 
 def butter_bandpass_filter(data, lowcut, highcut, fs, order=5):
-    """Applies a Butterworth band-pass filter to the audio data."""
+    """
+    Applies a Butterworth band-pass filter to the audio data, keeping its
+    dtype. Second-order sections keep the filter stable in float32.
+    """
     nyq = 0.5 * fs
     low = lowcut / nyq
     high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    y = lfilter(b, a, data)
+    sos = butter(order, [low, high], btype='band', output='sos')
+    dtype = data.dtype if data.dtype in (np.float32, np.float64) else np.float64
+    y = sosfilt(sos.astype(dtype), data)
     return y
 
 def reduce_noise_spectral_gating(audio_data, sample_rate):
     """A simple spectral gating implementation for noise reduction."""
     stft = librosa.stft(audio_data)
-    stft_mag, stft_phase = librosa.magphase(stft)
+    stft_mag = np.abs(stft, out=_work_buffer('stft_mag', stft.shape, stft.real.dtype))
     
     # Estimate noise profile from the first few frames
     noise_profile = np.mean(stft_mag[:, :5], axis=1)
     
-    # Create a mask to gate noise
-    mask = (stft_mag > (noise_profile[:, np.newaxis] * 2.0))
-    
-    # Apply mask
-    stft_mag_denoised = stft_mag * mask
+    # Gate bins below the noise threshold in place (same as magnitude * mask * phase)
+    stft[stft_mag <= (noise_profile[:, np.newaxis] * 2.0)] = 0
     
     # Inverse STFT to get denoised audio
-    y_denoised = librosa.istft(stft_mag_denoised * stft_phase, length=len(audio_data))
+    y_denoised = librosa.istft(stft, length=len(audio_data))
     return y_denoised
 
-def extract_features(y, sr):
-    """Extracts the 15 features the model was trained on."""
+PLANNED_STEPS = ('denoise', 'trim')
+
+class PreprocessingPlanner:
+    """
+    Chooses the optional pre-processing steps for a recording from its
+    quality report. On clean recordings spectral gating barely changes the
+    features, and select_voiced_segments drops the same leading and trailing
+    silence as trim, so both are skipped when the SNR was measured at
+    `skip_snr` dB or more (None runs every step). A running cost per audio
+    second of each step estimates the time a skipped step saved.
+    """
+
+    def __init__(self, skip_snr=None, smoothing=0.1):
+        self.skip_snr = skip_snr
+        self.smoothing = smoothing
+        self.cost_per_second = {}
+        self._lock = threading.Lock()
+
+    def plan(self, quality_report):
+        """Returns {step: run it} for PLANNED_STEPS."""
+        clean = (self.skip_snr is not None and quality_report.get('snr_measured', False)
+                 and quality_report['snr'] >= self.skip_snr)
+        return {step: not clean for step in PLANNED_STEPS}
+
+    def record(self, step, seconds, audio_seconds):
+        if audio_seconds <= 0:
+            return
+        cost = seconds / audio_seconds
+        with self._lock:
+            previous = self.cost_per_second.get(step, cost)
+            self.cost_per_second[step] = previous + self.smoothing * (cost - previous)
+
+    def saved_seconds(self, plan, audio_seconds):
+        """Estimated time saved by the skipped steps (0 for steps never timed yet)."""
+        return sum(self.cost_per_second.get(step, 0.0) * audio_seconds
+                   for step, run in plan.items() if not run)
+
+def select_analysis_window(y, sr, window_seconds, hop_length=512):
+    """
+    Picks the most stable voiced window of `window_seconds` from a longer
+    recording using frame RMS only (cheap compared to pyin/HPSS): the window
+    with the highest mean/std energy ratio, weighted by loudness.
+    Returns a copy of the window, so the full signal can be released, and
+    its start time in seconds.
+    """
+    window = int(window_seconds * sr)
+    if window <= 0 or len(y) <= window:
+        return y, 0.0
+
+    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+    n = max(1, window // hop_length)
+    csum = np.concatenate([[0.0], np.cumsum(rms, dtype=np.float64)])
+    csum_sq = np.concatenate([[0.0], np.cumsum(rms.astype(np.float64) ** 2)])
+    mean = (csum[n:] - csum[:-n]) / n
+    std = np.sqrt(np.maximum((csum_sq[n:] - csum_sq[:-n]) / n - mean ** 2, 0))
+    score = mean / (std + 1e-3 * mean.max() + 1e-10) * (mean / (mean.max() + 1e-10))
+
+    start = min(int(np.argmax(score)) * hop_length, len(y) - window)
+    return y[start:start + window].copy(), start / sr
+
+def select_voiced_segments(y, sr, top_db=20, min_segment_seconds=0.25, max_seconds=None):
+    """
+    Keeps only the sustained-phonation parts of a recording so pyin and HPSS
+    do not run over pauses, breaths and silence between attempts.
+    Segments from librosa.effects.split shorter than `min_segment_seconds`
+    are dropped; with `max_seconds`, the longest segments are kept up to that
+    total. Returns the concatenated voiced audio (in original order), or `y`
+    unchanged if no segment qualifies.
+    """
+    intervals = librosa.effects.split(y, top_db=top_db)
+    intervals = intervals[(intervals[:, 1] - intervals[:, 0]) >= int(min_segment_seconds * sr)]
+    if len(intervals) == 0:
+        return y
+
+    if max_seconds:
+        budget = int(max_seconds * sr)
+        selected = []
+        for start, end in sorted(intervals, key=lambda iv: iv[0] - iv[1]):  # longest first
+            if budget <= 0:
+                break
+            selected.append((start, min(end, start + budget)))
+            budget -= end - start
+        intervals = sorted(selected)
+
+    if len(intervals) == 1 and intervals[0][0] == 0 and intervals[0][1] == len(y):
+        return y
+    return np.concatenate([y[start:end] for start, end in intervals])
+
+def extract_display_features(y, sr):
+    """Cheap spectral descriptors shown in the web UI (not used by the model)."""
+    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    return {
+        'mfccs': np.mean(mfccs, axis=1).tolist(),
+        'zcr': float(np.mean(librosa.feature.zero_crossing_rate(y))),
+        'spectral_centroid': float(np.mean(librosa.feature.spectral_centroid(y=y, sr=sr)))
+    }
+
+def _pitch_and_amplitude_features(f0, y):
+    """MDVP:Fo/Fhi/Flo, jitter and shimmer from a voiced F0 track and the signal."""
     features = []
-    
-    # Pitch and related features
-    f0, _, _ = librosa.pyin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'))
-    f0 = f0[~np.isnan(f0)]
-    if len(f0) < 2: f0 = np.array([150, 151]) # Default if no pitch found
-    
     features.append(np.mean(f0))  # MDVP:Fo(Hz)
     features.append(np.max(f0))   # MDVP:Fhi(Hz)
     features.append(np.min(f0))   # MDVP:Flo(Hz)
@@ -121,14 +243,49 @@ def extract_features(y, sr):
     shimmer = np.mean(np.abs(np.diff(rms))) / np.mean(rms) if np.mean(rms) > 0 else 0
     features.append(shimmer)      # MDVP:Shimmer
     features.append(librosa.amplitude_to_db(shimmer) if shimmer > 0 else -100) # MDVP:Shimmer(dB)
+    return features
+
+def extract_cheap_features(y, sr, timer=None):
+    """
+    The first 7 model features (F0 statistics, jitter, shimmer) using the
+    fast YIN pitch tracker instead of pyin, and no HPSS. This is the first
+    stage of the server's cascade mode.
+    """
+    timer = timer or _no_timer
+    with timer('yin'):
+        f0 = librosa.yin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr)
+    f0 = f0[np.isfinite(f0)]
+    if len(f0) < 2: f0 = np.array([150, 151]) # Default if no pitch found
+    return _pitch_and_amplitude_features(f0, y)
+
+def extract_features(y, sr, timer=None, extras=None):
+    """
+    Extracts the 15 features the model was trained on.
+    `timer(stage)` may return a context manager used to time the expensive
+    stages ('pyin', 'hpss'); it defaults to a no-op. If `extras` is a dict,
+    it also receives display-only values computed along the way ('pitch_std').
+    """
+    timer = timer or _no_timer
+    
+    # Pitch and related features
+    with timer('pyin'):
+        f0, _, _ = librosa.pyin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'))
+    f0 = f0[~np.isnan(f0)]
+    if len(f0) < 2: f0 = np.array([150, 151]) # Default if no pitch found
+    if extras is not None:
+        extras['pitch_std'] = float(np.std(f0))
+    
+    # Fo/Fhi/Flo, jitter and shimmer
+    features = _pitch_and_amplitude_features(f0, y)
 
     # Harmonics-to-Noise Ratio (HNR)
-    harmonic, percussive = librosa.effects.hpss(y)
+    with timer('hpss'):
+        harmonic, percussive = librosa.effects.hpss(y)
     # Ensure percussive power is not zero to avoid division errors
-    percussive_power = np.mean(percussive**2)
+    percussive_power = _energy(percussive) / len(percussive)
     if percussive_power < 1e-10: percussive_power = 1e-10
     
-    hnr = np.mean(harmonic**2) / percussive_power
+    hnr = (_energy(harmonic) / len(harmonic)) / percussive_power
     nhr = 1 / hnr if hnr > 0 else 100
     
     features.append(nhr) # NHR (Noise-to-Harmonics Ratio)
@@ -145,4 +302,4 @@ def extract_features(y, sr):
         0.2   # PPE
     ])
     
-    return features
\ No newline at end of file
+    return features
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the audio -> prediction pipeline.
+
+Generates synthetic sustained-vowel recordings, times each audio_processor
+function and the end-to-end /process_and_predict path, and stores the
+results as JSON so runs from different commits can be compared.
+
+Usage:
+    python benchmark_pipeline.py                          # 5/15/60 s recordings
+    python benchmark_pipeline.py --durations 5 --repeats 20
+    python benchmark_pipeline.py --compare bench_results/<old>.json
+    python benchmark_pipeline.py --check-precision        # float32 vs float64 features and SNR
+    python benchmark_pipeline.py --check-plan --skip-snr 35  # features with skipped pre-processing
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import librosa
+
+from audio_processor import analyze_audio_quality, butter_bandpass_filter, reduce_noise_spectral_gating, extract_features, select_voiced_segments, PreprocessingPlanner
+from synthetic_audio import generate_sustained_vowel, to_wav_bytes
+
+warnings.filterwarnings('ignore')
+
+SR = 22050
+
+def summarize(latencies, audio_seconds):
+    """Latency percentiles (ms) and throughput for a list of wall times in seconds."""
+    latencies = np.asarray(latencies)
+    return {
+        'runs': len(latencies),
+        'mean_ms': float(np.mean(latencies) * 1000),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'calls_per_s': float(1 / np.mean(latencies)),
+        'audio_s_per_s': float(audio_seconds / np.mean(latencies))
+    }
+
+def measure(fn, repeats, audio_seconds):
+    """Times `fn` after one warm-up call, then measures its peak Python allocation."""
+    fn()  # warm-up: numba JIT, FFT plans, caches
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    result = summarize(latencies, audio_seconds)
+
+    # Separate run, since tracemalloc slows allocation-heavy code
+    tracemalloc.start()
+    fn()
+    result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result
+
+def benchmark_functions(y, repeats):
+    """Times each audio_processor stage on the input it receives in the server pipeline."""
+    audio_seconds = len(y) / SR
+    y_filtered = butter_bandpass_filter(y, 300, 1500, SR)
+    y_denoised = reduce_noise_spectral_gating(y_filtered, SR)
+    y_trimmed, _ = librosa.effects.trim(y_denoised, top_db=20)
+    y_voiced = select_voiced_segments(y_trimmed, SR)
+
+    stages = {
+        'analyze_audio_quality': lambda: analyze_audio_quality(y, SR),
+        'butter_bandpass_filter': lambda: butter_bandpass_filter(y, 300, 1500, SR),
+        'reduce_noise_spectral_gating': lambda: reduce_noise_spectral_gating(y_filtered, SR),
+        'trim': lambda: librosa.effects.trim(y_denoised, top_db=20),
+        'select_voiced_segments': lambda: select_voiced_segments(y_trimmed, SR),
+        'extract_features': lambda: extract_features(y_voiced, SR)
+    }
+    results = {}
+    for name, fn in stages.items():
+        print(f"  {name}...", flush=True)
+        results[name] = measure(fn, repeats, audio_seconds)
+    return results
+
+def run_pipeline(y, plan=None):
+    """Server pre-processing and feature extraction, in the dtype of `y`, skipping steps `plan` marks False."""
+    plan = plan or {}
+    y = butter_bandpass_filter(y, 300, 1500, SR)
+    if plan.get('denoise', True):
+        y = reduce_noise_spectral_gating(y, SR)
+    if plan.get('trim', True):
+        y, _ = librosa.effects.trim(y, top_db=20)
+    return np.array(extract_features(select_voiced_segments(y, SR), SR))
+
+def check_precision(y, rtol=1e-3):
+    """
+    Runs the pipeline in float64 and float32 and compares the features.
+    Returns the largest relative difference and whether it is within `rtol`.
+    """
+    features64 = run_pipeline(y.astype(np.float64))
+    features32 = run_pipeline(y.astype(np.float32))
+    relative = np.abs(features32 - features64) / np.maximum(np.abs(features64), 1e-6)
+    worst = int(np.argmax(relative))
+    print(f"  float32 vs float64: max relative feature difference {relative[worst]:.2e} (feature {worst})")
+    return float(relative[worst]), bool(relative[worst] <= rtol)
+
+SNR_PRECISION_CASES = ((5, 50), (60, 40), (120, 50))  # (seconds, dB): long or clean recordings
+
+def check_snr_precision(duration, snr_db, atol=0.1):
+    """
+    Compares the quality check's SNR for float32 and float64 input; float32
+    sums of squares over minutes of clean audio used to drift by dB.
+    Returns whether they agree within `atol` dB and both were measured.
+    """
+    y = generate_sustained_vowel(duration, SR, snr_db=snr_db)
+    report32 = analyze_audio_quality(y.astype(np.float32), SR)
+    report64 = analyze_audio_quality(y.astype(np.float64), SR)
+    difference = abs(report32['snr'] - report64['snr'])
+    measured = report32['snr_measured'] and report64['snr_measured']
+    print(f"  {duration:g} s, {snr_db:g} dB noise: SNR float32 {report32['snr']:.2f} dB, "
+          f"float64 {report64['snr']:.2f} dB{'' if measured else ' (not measured)'}")
+    return bool(difference <= atol and measured)
+
+def skipped_seconds(y, plan):
+    """Time the steps `plan` skips take on `y` (pyin's run-to-run noise would hide it end to end)."""
+    y = butter_bandpass_filter(y, 300, 1500, SR)
+    start = time.perf_counter()
+    if not plan['denoise']:
+        y = reduce_noise_spectral_gating(y, SR)
+    if not plan['trim']:
+        librosa.effects.trim(y, top_db=20)
+    return time.perf_counter() - start
+
+def check_plan(skip_snr, durations, snrs=(20, 25, 30, 35, 40), f0s=(110, 180), seeds=(0, 1), ptol=0.05):
+    """
+    Runs a corpus of synthetic vowels through the full pipeline and through
+    the adaptive plan for `skip_snr`, and compares the features and the
+    served model's output for every recording that had steps skipped.
+    Fhi, Flo and jitter are extremes of the pitch track, so one glitched
+    frame in either run moves them; the check therefore passes when every
+    prediction is unchanged and its probability moves by at most `ptol`.
+    """
+    from model_registry import ModelBundle, DEFAULT_VERSION
+    bundle = ModelBundle(DEFAULT_VERSION, '.')
+    planner = PreprocessingPlanner(skip_snr)
+    passed = True
+    for duration in durations:
+        for snr_db in snrs:
+            for f0 in f0s:
+                for seed in seeds:
+                    y = generate_sustained_vowel(duration, SR, f0=f0, snr_db=snr_db, seed=seed)
+                    quality_report = analyze_audio_quality(y, SR)
+                    plan = planner.plan(quality_report)
+                    label = (f"  {duration:g} s, {snr_db:g} dB noise, f0 {f0:g} Hz, seed {seed}: "
+                             f"measured SNR {quality_report['snr']:g} dB")
+                    if all(plan.values()):
+                        print(f"{label}, all steps run")
+                        continue
+                    full = run_pipeline(y)
+                    planned = run_pipeline(y, plan)
+                    relative = np.abs(planned - full) / np.maximum(np.abs(full), 1e-6)
+                    worst = int(np.argmax(relative))
+                    _, predictions, probabilities = bundle.predict(np.vstack([full, planned]))
+                    difference = abs(probabilities[1, 1] - probabilities[0, 1])
+                    ok = predictions[0] == predictions[1] and difference <= ptol
+                    passed &= ok
+                    print(f"{label}, skipped {', '.join(step for step, run in plan.items() if not run)}: "
+                          f"max relative feature difference {relative[worst]:.2e} ({bundle.feature_names[worst]}), "
+                          f"probability difference {difference:.3f}, "
+                          f"{skipped_seconds(y, plan) * 1000:.1f} ms saved{'' if ok else '  <-- FAIL'}")
+    return passed
+
+def benchmark_end_to_end(wav_bytes, audio_seconds, repeats):
+    """Times POST /process_and_predict through the Flask test client."""
+    # Keep benchmark results out of the real results store
+    os.environ.setdefault('RESULTS_DB', os.path.join(tempfile.gettempdir(), 'parkinsons_benchmark.db'))
+    import model_server
+    client = model_server.app.test_client()
+
+    def request_once():
+        response = client.post('/process_and_predict', data={'audio': (io.BytesIO(wav_bytes), 'recording.wav')},
+                               headers={'Cache-Control': 'no-coalesce'})  # time the analysis every repeat
+        if response.status_code != 200:
+            raise RuntimeError(f"/process_and_predict returned {response.status_code}: {response.get_json()}")
+
+    try:
+        return measure(request_once, repeats, audio_seconds)
+    except Exception as e:
+        print(f"  end-to-end benchmark skipped: {e}")
+        return {'error': str(e)}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+def compare(current, baseline_path, threshold=0.10):
+    """Prints p50/p95 changes against a previous results file, flagging regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison against {baseline.get('commit', '?')} ({baseline_path}):")
+    for duration, cases in current['results'].items():
+        for name, result in cases.items():
+            old = baseline['results'].get(duration, {}).get(name)
+            if not old or 'error' in result or 'error' in old:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'peak_memory_mb'):
+                change = result[metric] / old[metric] - 1 if old[metric] else 0.0
+                flag = '  <-- regression' if change > threshold else ''
+                print(f"  {duration:>4} {name:<30} {metric:<15} {old[metric]:10.2f} -> {result[metric]:10.2f} ({change:+.1%}){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audio -> prediction pipeline.")
+    parser.add_argument('--durations', type=float, nargs='+', default=[5, 15, 60], help='Recording lengths in seconds')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--f0', type=float, default=140.0)
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--shimmer', type=float, default=0.03)
+    parser.add_argument('--snr-db', type=float, default=30.0)
+    parser.add_argument('--skip-end-to-end', action='store_true')
+    parser.add_argument('--output-dir', default='bench_results')
+    parser.add_argument('--compare', metavar='JSON', help='Previous results file to compare against')
+    parser.add_argument('--check-precision', action='store_true',
+                        help='Only check that float32 features match float64 within --rtol')
+    parser.add_argument('--rtol', type=float, default=1e-3)
+    parser.add_argument('--check-plan', action='store_true',
+                        help='Only check features with the adaptive pre-processing plan against the full pipeline')
+    parser.add_argument('--skip-snr', type=float, default=35.0, help='PREPROCESS_SKIP_SNR to validate')
+    parser.add_argument('--plan-ptol', type=float, default=0.05, help='Largest allowed change in model probability')
+    args = parser.parse_args()
+
+    if args.check_plan:
+        print(f"Checking pre-processing plan with PREPROCESS_SKIP_SNR={args.skip_snr:g}", flush=True)
+        passed = check_plan(args.skip_snr, args.durations, ptol=args.plan_ptol)
+        print("\nPASS" if passed else f"\nFAIL: a prediction changed or its probability moved by more than {args.plan_ptol:g}")
+        sys.exit(0 if passed else 1)
+
+    if args.check_precision:
+        passed = True
+        for duration in args.durations:
+            print(f"\nChecking precision on {duration:g} s recording", flush=True)
+            y = generate_sustained_vowel(duration, SR, args.f0, args.jitter, args.shimmer, args.snr_db)
+            passed &= check_precision(y, args.rtol)[1]
+        print("\nChecking SNR precision", flush=True)
+        for duration, snr_db in SNR_PRECISION_CASES:
+            passed &= check_snr_precision(duration, snr_db)
+        print("\nPASS" if passed else f"\nFAIL: float32 features differ by more than {args.rtol:g}, "
+              f"or a float32 SNR is off by more than 0.1 dB")
+        sys.exit(0 if passed else 1)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'results': {}
+    }
+
+    for duration in args.durations:
+        print(f"\nBenchmarking {duration:g} s recording", flush=True)
+        y = generate_sustained_vowel(duration, SR, args.f0, args.jitter, args.shimmer, args.snr_db)
+        audio_seconds = len(y) / SR
+        cases = benchmark_functions(y, args.repeats)
+        if not args.skip_end_to_end:
+            print("  /process_and_predict...", flush=True)
+            cases['process_and_predict'] = benchmark_end_to_end(to_wav_bytes(y, SR), audio_seconds, args.repeats)
+        report['results'][f"{duration:g}s"] = cases
+
+        for name, result in cases.items():
+            if 'error' not in result:
+                print(f"  {name:<30} p50 {result['p50_ms']:9.1f} ms  p95 {result['p95_ms']:9.1f} ms  "
+                      f"p99 {result['p99_ms']:9.1f} ms  {result['audio_s_per_s']:7.1f} audio-s/s  "
+                      f"peak {result['peak_memory_mb']:7.1f} MB")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"{report['commit']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved as: {output_path}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Finds the thread configuration for this machine's thread budget.
+
+Inference: single-row latency and batch throughput of the served model for
+each XGBoost/sklearn thread count. Extraction: recordings per second when C
+recordings run at once, each with cores // C BLAS/OpenMP threads. Prints the
+settings to use as INFERENCE_THREADS and EXTRACTION_WORKERS.
+
+Usage:
+    python benchmark_threads.py
+    python benchmark_threads.py --cores 8 --batch-size 1024 --audio-duration 5
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import warnings
+
+import joblib
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+from benchmark_pipeline import SR, git_commit, run_pipeline
+from synthetic_audio import generate_sustained_vowel
+from thread_budget import ThreadBudget, available_cores
+from tree_ensemble import FlatEnsemble
+
+warnings.filterwarnings('ignore')
+
+def thread_counts(cores):
+    counts, n = [], 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    return counts + [cores]
+
+def time_calls(fn, repeats):
+    fn()  # warm-up
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return np.asarray(latencies)
+
+def benchmark_inference(model, X_scaled, cores, batch_size, repeats):
+    """Per thread count: p50/p95 single-row predict_proba latency and batch rows/s."""
+    budget = ThreadBudget(cores=cores)
+    row, batch = X_scaled[:1], X_scaled[:batch_size]
+    results = []
+    for threads in thread_counts(cores):
+        budget.configure_model(model, threads)
+        single = time_calls(lambda: model.predict_proba(row), repeats)
+        batched = time_calls(lambda: model.predict_proba(batch), max(3, repeats // 20))
+        results.append({
+            'threads': threads,
+            'single_p50_us': float(np.percentile(single, 50) * 1e6),
+            'single_p95_us': float(np.percentile(single, 95) * 1e6),
+            'batch_rows_per_s': float(len(batch) / np.median(batched))
+        })
+        print(f"  threads={threads:<3} single p50 {results[-1]['single_p50_us']:8.1f} us  "
+              f"p95 {results[-1]['single_p95_us']:8.1f} us  batch {results[-1]['batch_rows_per_s']:10.0f} rows/s")
+    return results
+
+def benchmark_extraction(y, cores, duration):
+    """Per concurrency C (threads = cores // C): recordings/s and mean latency over `duration` seconds."""
+    results = []
+    for concurrency in thread_counts(cores):
+        threads = max(1, cores // concurrency)
+        latencies, lock = [], threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            with threadpool_limits(limits=threads):
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    run_pipeline(y)
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+
+        with threadpool_limits(limits=threads):
+            run_pipeline(y)  # warm-up
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        results.append({
+            'concurrency': concurrency,
+            'library_threads': threads,
+            'recordings_per_s': len(latencies) / elapsed,
+            'mean_latency_ms': float(np.mean(latencies) * 1000)
+        })
+        print(f"  concurrency={concurrency:<3} threads={threads:<3} {results[-1]['recordings_per_s']:6.2f} rec/s  "
+              f"mean latency {results[-1]['mean_latency_ms']:8.0f} ms")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thread settings for inference and extraction.")
+    parser.add_argument('--cores', type=int, default=available_cores(), help='Core budget for one server worker')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--repeats', type=int, default=500, help='Timed single-row predictions per setting')
+    parser.add_argument('--audio-duration', type=float, default=5)
+    parser.add_argument('--extraction-seconds', type=float, default=30, help='Run time per extraction setting')
+    parser.add_argument('--output-dir', default='bench_results')
+    args = parser.parse_args()
+
+    model = joblib.load('parkinsons_model.pkl')
+    scaler = joblib.load('feature_scaler.pkl')
+    X_scaled = np.random.default_rng(0).standard_normal((args.batch_size, scaler.n_features_in_))
+
+    print(f"Inference ({type(model).__name__}, {args.cores} cores)", flush=True)
+    inference = benchmark_inference(model, X_scaled, args.cores, args.batch_size, args.repeats)
+    flat_path = 'parkinsons_model.npz'
+    if os.path.exists(flat_path):
+        ensemble = FlatEnsemble.load(flat_path)
+        flat = time_calls(lambda: ensemble.predict_proba(X_scaled[:1]), args.repeats)
+        print(f"  flat ensemble (NumPy) single p50 {np.percentile(flat, 50) * 1e6:8.1f} us")
+
+    print(f"\nExtraction ({args.audio_duration:g} s recording)", flush=True)
+    y = generate_sustained_vowel(args.audio_duration, SR)
+    extraction = benchmark_extraction(y, args.cores, args.extraction_seconds)
+
+    best_latency = min(inference, key=lambda r: r['single_p50_us'])
+    best_batch = max(inference, key=lambda r: r['batch_rows_per_s'])
+    best_extraction = max(extraction, key=lambda r: r['recordings_per_s'])
+    recommendation = {
+        'INFERENCE_THREADS': best_latency['threads'],
+        'batch_inference_threads': best_batch['threads'],
+        'EXTRACTION_WORKERS': best_extraction['concurrency']
+    }
+    print(f"\nSingle-row latency is best with {best_latency['threads']} inference thread(s); "
+          f"batches of {args.batch_size} with {best_batch['threads']}.")
+    print(f"Extraction throughput is best with {best_extraction['concurrency']} concurrent recording(s) "
+          f"x {best_extraction['library_threads']} BLAS thread(s).")
+    print(f"Suggested settings: INFERENCE_THREADS={recommendation['INFERENCE_THREADS']} "
+          f"EXTRACTION_WORKERS={recommendation['EXTRACTION_WORKERS']} CPU_BUDGET={args.cores}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"threads-{git_commit()}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output_path, 'w') as f:
+        json.dump({'cores': args.cores, 'config': vars(args), 'inference': inference,
+                   'extraction': extraction, 'recommendation': recommendation}, f, indent=2)
+    print(f"Results saved as: {output_path}")
+
+if __name__ == "__main__":
+    main()
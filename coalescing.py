@@ -0,0 +1,175 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+    FILE_LOCKS_AVAILABLE = True
+except ImportError:  # no flock on Windows: coalesce within this process only
+    fcntl = None
+    FILE_LOCKS_AVAILABLE = False
+
+def request_key(payload, *params):
+    """sha256 of the request body and the parameters that change its result."""
+    digest = hashlib.sha256(payload)
+    for param in params:
+        digest.update(b'\0' + str(param).encode('utf-8'))
+    return digest.hexdigest()
+
+class Coalescer:
+    """
+    Runs one computation per key at a time and hands its result to every
+    duplicate that was waiting on it. Threads wait on the leader's event;
+    other worker processes register as waiters in a state file under
+    `directory`, then wait on a flock'd file. The leader leaves its JSON
+    result only for those registered waiters, stamped with a generation so
+    a later request never reads it, and the last waiter deletes it.
+    """
+
+    def __init__(self, directory=None, wait_timeout=120.0):
+        self.directory = directory if FILE_LOCKS_AVAILABLE else None
+        self.wait_timeout = wait_timeout
+        self.stats = {'thread': 0, 'process': 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def run(self, key, fn):
+        """
+        Returns (result, shared): fn()'s result, computed here or by the
+        duplicate already in flight (shared is 'thread', 'process' or None).
+        A leader's exception is raised in the threads that waited on it.
+        """
+        with self._lock:
+            entry = self._inflight.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._inflight[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        if not leader:
+            if entry['done'].wait(self.wait_timeout):
+                self._count('thread')
+                if entry['error'] is not None:
+                    raise entry['error']
+                return entry['result'], 'thread'
+            return fn(), None  # the leader is stuck; don't wait forever
+
+        try:
+            entry['result'], shared = self._run_across_processes(key, fn)
+            return entry['result'], shared
+        except Exception as e:
+            entry['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            entry['done'].set()
+
+    def _count(self, scope):
+        with self._lock:
+            self.stats[scope] += 1
+
+    def _run_across_processes(self, key, fn):
+        if not self.directory:
+            return fn(), None
+        path = os.path.join(self.directory, key)
+        fd = os.open(path + '.lock', os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            if not self._try_lock(fd):  # another worker is computing it
+                with self._state(path) as state:
+                    seen = state['generation']
+                    state['waiters'] += 1
+                try:
+                    locked = self._wait_lock(fd)
+                    result = self._read_result(path, seen) if locked else None
+                finally:
+                    with self._state(path) as state:
+                        state['waiters'] -= 1
+                        if not state['waiters']:
+                            self._remove(path + '.json')
+                if result is not None:
+                    self._count('process')
+                    return result['result'], 'process'
+                if not locked:
+                    return fn(), None
+                # The leader failed: compute it here, for whoever is waiting now
+            os.utime(path + '.lock')  # marks the lock as in use for _expire
+            result = fn()
+            self._finish(path, result)
+            return result, None
+        finally:
+            os.close(fd)  # releases the flock
+
+    def _try_lock(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _wait_lock(self, fd):
+        deadline = time.monotonic() + self.wait_timeout
+        while not self._try_lock(fd):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    @contextlib.contextmanager
+    def _state(self, path):
+        """{'generation', 'waiters'} for a key, read and written under its own flock."""
+        fd = os.open(path + '.state', os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = json.loads(os.read(fd, 4096) or b'{}')
+            except ValueError:
+                state = {}
+            state = {'generation': state.get('generation', 0), 'waiters': max(0, state.get('waiters', 0))}
+            yield state
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps(state).encode())
+        finally:
+            os.close(fd)
+
+    def _finish(self, path, result):
+        """Bumps the generation and, if anyone is waiting, leaves them the result."""
+        try:
+            with self._state(path) as state:
+                state['generation'] += 1
+                if state['waiters']:
+                    with os.fdopen(os.open(path + '.tmp', os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), 'w') as f:
+                        json.dump({'generation': state['generation'], 'result': result}, f)
+                    os.replace(path + '.tmp', path + '.json')
+            self._expire()
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️ Could not share coalesced result: {e}")
+
+    def _read_result(self, path, seen):
+        """The result of a leader that finished after this waiter registered, or None."""
+        try:
+            with open(path + '.json') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return result if result.get('generation', 0) > seen else None
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _expire(self):
+        """Removes files of keys nobody has touched for a while (e.g. left by a killed worker)."""
+        cutoff = time.time() - self.wait_timeout - 60.0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
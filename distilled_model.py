@@ -0,0 +1,65 @@
+import os
+import joblib
+import numpy as np
+
+DISTILLED_MODEL_FILE = 'distilled_model.pkl'
+
+class DistilledModel:
+    """
+    One shallow regression tree fitted to the full ensemble's probabilities
+    (soft labels). Served as the fallback tier under load: `max_depth` array
+    lookups per row instead of a walk through every tree of the ensemble, at
+    a small cost in accuracy.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, max_depth, agreement=None, accuracy=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)  # P(class 1) at each leaf
+        self.max_depth = int(max_depth)
+        self.agreement = agreement  # share of held-out rows where it predicts what the ensemble does
+        self.accuracy = accuracy
+
+    @classmethod
+    def from_tree(cls, model, agreement=None, accuracy=None):
+        """Flattens a fitted DecisionTreeRegressor; leaves point to themselves."""
+        tree = model.tree_
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(tree.node_count)
+        return cls(np.where(is_leaf, 0, tree.feature), np.where(is_leaf, 0.0, tree.threshold),
+                   np.where(is_leaf, node_ids, tree.children_left), np.where(is_leaf, node_ids, tree.children_right),
+                   np.clip(tree.value[:, 0, 0], 0.0, 1.0), tree.max_depth, agreement, accuracy)
+
+    def save(self, directory='.'):
+        path = os.path.join(directory, DISTILLED_MODEL_FILE)
+        joblib.dump({'feature': self.feature, 'threshold': self.threshold, 'left': self.left, 'right': self.right,
+                     'value': self.value, 'max_depth': self.max_depth,
+                     'agreement': self.agreement, 'accuracy': self.accuracy}, path)
+        return path
+
+    @classmethod
+    def load(cls, directory='.'):
+        """Loads distilled_model.pkl written by the trainer, or returns None."""
+        path = os.path.join(directory, DISTILLED_MODEL_FILE)
+        if not os.path.exists(path):
+            return None
+        stats = joblib.load(path)
+        return cls(stats['feature'], stats['threshold'], stats['left'], stats['right'], stats['value'],
+                   stats['max_depth'], stats.get('agreement'), stats.get('accuracy'))
+
+    def predict_proba(self, X_scaled):
+        """Class probabilities for already-scaled rows, shape (n_rows, 2)."""
+        # scikit-learn compares float32 features against the thresholds
+        X = np.atleast_2d(np.asarray(X_scaled, dtype=np.float32)).astype(np.float64)
+        rows = np.arange(len(X))
+        nodes = np.zeros(len(X), dtype=np.int32)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        positive = self.value[nodes]
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X_scaled):
+        return self.predict_proba(X_scaled).argmax(axis=1)
@@ -4,66 +4,84 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import streamlit as st
 
-def plot_shap_summary(explainer, X_scaled, feature_names):
-    """Generates and displays a SHAP summary bar chart."""
-    shap_values = explainer(X_scaled)
-    
+def plot_shap_summary(explanation, feature_names):
+    """
+    Generates and displays a SHAP summary bar chart from the cached
+    values returned by ExplanationService.explain.
+    """
     fig, ax = plt.subplots()
-    shap.summary_plot(shap_values.values, feature_names=feature_names, plot_type="bar", show=False)
+    shap.summary_plot(explanation['values'], feature_names=feature_names, plot_type="bar", show=False)
     st.pyplot(fig)
 
-def plot_shap_force_plot(explainer, X_scaled, feature_names):
+def plot_shap_force_plot(explanation, feature_names):
     """Generates and displays a SHAP force plot for a single prediction."""
-    shap_values = explainer(X_scaled)
-    
     # SHAP force plot requires a JS visualization, so we use st.components.v1
     force_plot_html = shap.force_plot(
-        explainer.expected_value, 
-        shap_values.values[0], 
+        explanation['base_value'], 
+        explanation['values'][0], 
         feature_names,
         link="logit",
         matplotlib=True
     )
     st.components.v1.html(force_plot_html.html(), height=150)
 
+STATUS_LABELS = np.array(['Normal', 'Elevated', 'Abnormal'])
+
+def compute_feature_status(X_scaled, training_stats):
+    """
+    Computes z-scores and status bands (Normal, Elevated, Abnormal) for a whole
+    batch of predictions against the training data distribution.
+    Returns NumPy arrays of shape (rows, features); bands index STATUS_LABELS.
+    """
+    values = np.atleast_2d(np.asarray(X_scaled, dtype=np.float64))
+    z_scores = (values - np.asarray(training_stats['mean'])) / (np.asarray(training_stats['std']) + 1e-6)
+    abs_z = np.abs(z_scores)
+    bands = (abs_z > 1.5).astype(np.int8) + (abs_z > 2.5)
+    return {
+        'columns': list(training_stats['columns']),
+        'values': values,
+        'z_scores': z_scores,
+        'bands': bands
+    }
+
+def render_feature_status(status, row=0):
+    """Formats one row of compute_feature_status output as a display table."""
+    return pd.DataFrame({
+        'Feature': status['columns'],
+        'Value': np.char.mod('%.3f', status['values'][row]),
+        'Status': STATUS_LABELS[status['bands'][row]],
+        'Z-Score': np.char.mod('%.2f', status['z_scores'][row])
+    })
+
+def render_feature_status_report(status):
+    """
+    Builds a long-format table (one line per recording and feature) for bulk
+    reports. Values stay numeric; round or format them when writing out.
+    """
+    n_rows, n_features = status['z_scores'].shape
+    return pd.DataFrame({
+        'Recording': np.repeat(np.arange(n_rows), n_features),
+        'Feature': np.tile(status['columns'], n_rows),
+        'Value': status['values'].ravel(),
+        'Status': STATUS_LABELS[status['bands'].ravel()],
+        'Z-Score': status['z_scores'].ravel()
+    })
+
 def get_feature_status(X_scaled, training_stats):
     """
     Determines the status (Normal, Elevated, Abnormal) of each feature
     by comparing it to the training data distribution.
     """
-    feature_names = training_stats['columns']
-    mean = training_stats['mean']
-    std = training_stats['std']
-    
-    status_list = []
-    for i, feature in enumerate(feature_names):
-        value = X_scaled[0, i]
-        z_score = (value - mean[i]) / (std[i] + 1e-6)
-        
-        status = "Normal"
-        if abs(z_score) > 2.5:
-            status = "Abnormal"
-        elif abs(z_score) > 1.5:
-            status = "Elevated"
-            
-        status_list.append({
-            'Feature': feature,
-            'Value': f"{value:.3f}",
-            'Status': status,
-            'Z-Score': f"{z_score:.2f}"
-        })
-    return pd.DataFrame(status_list)
+    return render_feature_status(compute_feature_status(X_scaled[:1], training_stats))
 
-def generate_plain_language_explanation(explainer, X_scaled, feature_names, prediction):
+def generate_plain_language_explanation(explanation, feature_names, prediction):
     """
     Generates a human-readable explanation of the prediction.
     """
-    shap_values = explainer(X_scaled)
-    
     # Get the top 3 features contributing to the prediction
     feature_impact = pd.DataFrame({
         'feature': feature_names,
-        'shap_value': shap_values.values[0]
+        'shap_value': explanation['values'][0]
     })
     
     if prediction == 1: # At Risk
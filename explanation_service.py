@@ -0,0 +1,103 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+class ExplainerUnavailable(RuntimeError):
+    """SHAP, or the pickled model it explains, could not be loaded."""
+
+class ExplanationService:
+    """
+    Computes SHAP values once per scaled feature row and caches them, so the
+    summary plot, force plot and text explanation all reuse one computation.
+    Rows are registered with every prediction, but the explainer (shap and
+    the pickled model) is only built for the first explanation.
+    """
+
+    def __init__(self, load_model, max_cache_size=4096):
+        self._load_model = load_model  # returns the fitted model
+        self._explainer = None
+        self.base_value = None
+        self.max_cache_size = max_cache_size
+        self._cache = OrderedDict()  # result_id -> {'row': ndarray, 'values': ndarray or None}
+        self._lock = threading.Lock()
+        self._explainer_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def explainer(self):
+        """Raises ExplainerUnavailable when shap or the model cannot be loaded."""
+        with self._explainer_lock:
+            if self._explainer is None:
+                try:
+                    import shap
+                    # Built from the model rather than unpickled: TreeExplainer uses the
+                    # fast tree-path algorithm and stays in sync with the served model.
+                    explainer = shap.TreeExplainer(self._load_model())
+                except Exception as e:
+                    raise ExplainerUnavailable(f"SHAP explainer unavailable: {e}") from e
+                self.base_value = self._positive_class(explainer.expected_value)
+                self._explainer = explainer
+            return self._explainer
+
+    @staticmethod
+    def _positive_class(value):
+        """Selects the 'At Risk' output from per-class SHAP outputs."""
+        if isinstance(value, list):
+            return value[1]
+        value = np.asarray(value)
+        if value.ndim == 3:  # (rows, features, classes)
+            return value[:, :, 1]
+        if value.ndim == 1 and len(value) <= 2:  # expected value, one entry per output
+            return float(value[-1])
+        return value if value.ndim else float(value)
+
+    @staticmethod
+    def result_id(row):
+        """Stable id for a scaled feature row, returned to clients with the prediction."""
+        return hashlib.sha1(np.ascontiguousarray(row, dtype=np.float64).tobytes()).hexdigest()[:16]
+
+    def register(self, X_scaled):
+        """Stores scaled rows without explaining them yet. Returns their result ids."""
+        X_scaled = np.atleast_2d(np.asarray(X_scaled, dtype=np.float64))
+        ids = [self.result_id(row) for row in X_scaled]
+        with self._lock:
+            for result_id, row in zip(ids, X_scaled):
+                if result_id in self._cache:
+                    self._cache.move_to_end(result_id)
+                else:
+                    self._cache[result_id] = {'row': row.copy(), 'values': None}
+            self._evict()
+        return ids
+
+    def explain(self, X_scaled):
+        """
+        Returns {'result_ids', 'base_value', 'values'} for a batch of scaled rows,
+        computing SHAP values in a single call for rows not already cached.
+        """
+        ids = self.register(X_scaled)
+        return self.explain_ids(ids)
+
+    def explain_ids(self, result_ids):
+        """Explains previously registered rows. Raises KeyError for unknown ids."""
+        explainer = self.explainer
+        with self._lock:
+            entries = [self._cache[result_id] for result_id in result_ids]
+        pending = [entry for entry in entries if entry['values'] is None]
+        self.hits += len(entries) - len(pending)
+        self.misses += len(pending)
+        if pending:
+            values = self._positive_class(explainer.shap_values(np.vstack([entry['row'] for entry in pending])))
+            for entry, row_values in zip(pending, np.atleast_2d(values)):
+                entry['values'] = row_values
+        return {
+            'result_ids': list(result_ids),
+            'base_value': self.base_value,
+            'values': np.vstack([entry['values'] for entry in entries])
+        }
+
+    def _evict(self):
+        while len(self._cache) > self.max_cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,107 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+class ProcessingError(Exception):
+    """A client-facing failure (bad audio, rejected input) with an error code and HTTP status."""
+
+    def __init__(self, message, code, status_code=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status_code = status_code
+        self.details = details
+
+    def to_dict(self):
+        error = {'code': self.code, 'message': self.message}
+        if self.details:
+            error.update(self.details)
+        return error
+
+class JobQueue:
+    """
+    Runs submitted work on a background thread pool and keeps each job's
+    status, current stage and outcome, so clients can poll or stream
+    progress instead of holding a connection open for the whole run.
+    Finished jobs are kept for `ttl` seconds, then forgotten.
+    """
+
+    def __init__(self, workers=1, ttl=300.0, max_pending=100):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._pending = 0
+        self._changed = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-worker')
+
+    def submit(self, fn, *args):
+        """
+        Queues fn(progress, *args), where progress(stage) reports the stage
+        being worked on. Returns the job id, or None when `max_pending` jobs
+        are already waiting or running.
+        """
+        job_id = uuid.uuid4().hex
+        with self._changed:
+            self._expire()
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+            self._jobs[job_id] = {'job_id': job_id, 'status': 'queued', 'stage': None, 'stages': [],
+                                  'submitted_at': time.time(), 'finished_at': None,
+                                  'result': None, 'error': None, 'version': 0}
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _update(self, job_id, **changes):
+        with self._changed:
+            job = self._jobs[job_id]
+            job.update(changes)
+            job['version'] += 1
+            self._changed.notify_all()
+
+    def _run(self, job_id, fn, args):
+        def progress(stage):
+            job = self._jobs[job_id]
+            if stage and stage != job['stage']:
+                self._update(job_id, stage=stage, stages=job['stages'] + [stage])
+
+        self._update(job_id, status='running')
+        try:
+            outcome = {'status': 'done', 'result': fn(progress, *args)}
+        except ProcessingError as e:
+            outcome = {'status': 'failed', 'error': e.to_dict()}
+        except Exception as e:
+            print(f"Job {job_id} error: {e}")
+            outcome = {'status': 'failed', 'error': {'code': 'JOB_FAILED', 'message': 'An unexpected error occurred.'}}
+        with self._changed:
+            self._pending -= 1
+        self._update(job_id, finished_at=time.time(), **outcome)
+
+    def _expire(self):
+        """Drops finished jobs older than the TTL. Call with the lock held."""
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """A snapshot of the job, or None if it is unknown or expired."""
+        with self._changed:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, version, timeout):
+        """
+        Blocks until the job changes past `version` or `timeout` seconds pass.
+        Returns the current snapshot (None if the job is gone).
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._jobs.get(job_id, {}).get('version', version + 1) > version,
+                                   timeout=timeout)
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self):
+        return self._pending
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Load-testing harness for the Flask model server.
+
+Replays a weighted mix of /test_mic, /process_and_predict, /predict and
+/export requests built from synthetic audio, so it runs fully offline, and reports
+latency-vs-throughput curves and the saturation point.
+
+Modes:
+    closed  - fixed number of concurrent clients, each sending back-to-back
+    open    - constant arrival rate regardless of response times
+    ramp    - arrival rate increasing linearly across the steps
+
+Usage:
+    python load_test.py --start-server --mode closed --concurrency 1 2 4 8 16
+    python load_test.py --mode open --rates 0.5 1 2 4 --step-duration 60
+    python load_test.py --mode ramp --rates 0.5 8 --steps 8 --mix test_mic=0.7,process_and_predict=0.3
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from synthetic_audio import generate_sustained_vowel, to_wav_bytes
+
+SR = 22050
+
+def multipart_body(fields, files):
+    """Encodes form fields and (name, filename, bytes) files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def build_requests(duration):
+    """Prepares one request body per endpoint: (method, path, body, content type)."""
+    wav = to_wav_bytes(generate_sustained_vowel(duration, SR), SR)
+    audio_body, audio_type = multipart_body({'language': 'en'}, [('audio', 'recording.wav', wav)])
+    history = [{'timestamp': '2024-01-01 12:00:00', 'prediction': i % 2, 'confidence': 80.0,
+                'quality_report': {'quality_score': 90, 'snr': 25.0, 'amplitude': 0.5}} for i in range(20)]
+    export_body = json.dumps({'format': 'csv', 'history': history}).encode()
+    features = [150.0, 180.0, 120.0, 0.5, 0.00003, 0.03, 0.3, 0.02, 21.0, 0.5, 0.7, -5.0, 0.2, 2.0, 0.2]
+    predict_body = json.dumps({'features': features}).encode()
+    return {
+        'test_mic': ('POST', '/test_mic', audio_body, audio_type),
+        'process_and_predict': ('POST', '/process_and_predict', audio_body, audio_type),
+        'predict': ('POST', '/predict', predict_body, 'application/json'),
+        'export': ('POST', '/export', export_body, 'application/json')
+    }
+
+class Client:
+    """Keep-alive HTTP connections, one per worker thread."""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self._local = threading.local()
+
+    def send(self, method, path, body, content_type):
+        """Returns (status code or None on connection error, latency in seconds)."""
+        start = time.perf_counter()
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                # Every upload is the same recording; measure real analyses, not shared results
+                conn.request(method, path, body=body,
+                             headers={'Content-Type': content_type, 'Cache-Control': 'no-coalesce'})
+                response = conn.getresponse()
+                response.read()
+                return response.status, time.perf_counter() - start
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+        return None, time.perf_counter() - start
+
+def summarize_step(label, value, records, wall_time):
+    latencies = np.array([latency for _, _, latency in records]) if records else np.zeros(1)
+    # 429/503 sheds answer fast; counting them as successes would flatter the latency
+    errors = sum(1 for _, status, _ in records if status is None or status >= 500 or status == 429)
+    per_endpoint = {}
+    for endpoint, status, latency in records:
+        per_endpoint.setdefault(endpoint, []).append(latency)
+    return {
+        label: value,
+        'requests': len(records),
+        'throughput_rps': len(records) / wall_time,
+        'error_rate': errors / max(len(records), 1),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'p95_ms_by_endpoint': {k: float(np.percentile(v, 95) * 1000) for k, v in per_endpoint.items()}
+    }
+
+def pick_endpoint(mix):
+    return random.choices(list(mix), weights=list(mix.values()))[0]
+
+def run_closed_step(client, requests, mix, concurrency, duration):
+    """`concurrency` clients sending back-to-back requests for `duration` seconds."""
+    records, lock = [], threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            endpoint = pick_endpoint(mix)
+            status, latency = client.send(*requests[endpoint])
+            with lock:
+                records.append((endpoint, status, latency))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - start
+
+def run_open_step(client, requests, mix, rate, duration, max_workers):
+    """
+    Poisson arrivals at `rate` requests/s. Latency is measured from the
+    scheduled send time, so queueing in the client counts (no coordinated omission).
+    """
+    records, lock = [], threading.Lock()
+
+    def fire(endpoint, scheduled):
+        status, _ = client.send(*requests[endpoint])
+        with lock:
+            records.append((endpoint, status, time.perf_counter() - scheduled))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        next_time = start
+        while next_time < start + duration:
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(fire, pick_endpoint(mix), next_time)
+            next_time += random.expovariate(rate)
+    return records, max(time.perf_counter() - start, duration)
+
+def find_saturation(steps, slo_ms, max_error_rate=0.01):
+    """
+    First step where p95 latency exceeds the SLO, errors exceed
+    max_error_rate, or throughput stops keeping up: below 90% of the offered
+    rate (open/ramp) or <5% above the previous step (closed).
+    """
+    for previous, step in zip([None] + steps[:-1], steps):
+        if step['p95_ms'] > slo_ms or step['error_rate'] > max_error_rate:
+            return step
+        if 'offered_rps' in step:
+            if step['throughput_rps'] < 0.9 * step['offered_rps']:
+                return step
+        elif previous and step['throughput_rps'] < previous['throughput_rps'] * 1.05:
+            return step
+    return None
+
+def start_server(port):
+    """Starts model_server.py on `port` and waits until it accepts connections."""
+    env = dict(os.environ, PORT=str(port), FLASK_DEBUG='0')
+    process = subprocess.Popen([sys.executable, 'model_server.py'], env=env)
+    for _ in range(300):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/metrics')
+            conn.getresponse().read()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError('model_server.py exited during startup')
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError('model_server.py did not start in time')
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, weight = item.split('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+def plot_curve(steps, path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    throughput = [step['throughput_rps'] for step in steps]
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+        ax.plot(throughput, [step[metric] for step in steps], marker='o', label=metric)
+    ax.set_xlabel('Throughput (requests/s)')
+    ax.set_ylabel('Latency (ms)')
+    ax.set_title('Model server latency vs throughput')
+    ax.legend()
+    fig.savefig(path, dpi=150, bbox_inches='tight')
+    print(f"Curve saved as: {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Flask model server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--start-server', action='store_true', help='Start model_server.py locally for the run')
+    parser.add_argument('--mode', choices=['closed', 'open', 'ramp'], default='closed')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8], help='Closed mode: clients per step')
+    parser.add_argument('--rates', type=float, nargs='+', default=[0.5, 1, 2, 4],
+                        help='Open mode: requests/s per step. Ramp mode: start and end rate')
+    parser.add_argument('--steps', type=int, default=8, help='Ramp mode: number of steps')
+    parser.add_argument('--step-duration', type=float, default=30, help='Seconds per step')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('test_mic=0.3,process_and_predict=0.6,export=0.1'))
+    parser.add_argument('--audio-duration', type=float, default=5, help='Synthetic recording length in seconds')
+    parser.add_argument('--slo-ms', type=float, default=10000, help='p95 latency considered saturated')
+    parser.add_argument('--max-workers', type=int, default=256, help='Open/ramp mode: max outstanding requests')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--plot', metavar='PNG', help='Also save a latency-vs-throughput plot')
+    args = parser.parse_args()
+
+    requests = build_requests(args.audio_duration)
+    unknown = set(args.mix) - set(requests)
+    if unknown:
+        parser.error(f"Unknown endpoints in --mix: {sorted(unknown)}")
+
+    server = start_server(args.port) if args.start_server else None
+    client = Client(args.host, args.port, args.timeout)
+    steps = []
+    try:
+        if args.mode == 'closed':
+            schedule = [('concurrency', c) for c in args.concurrency]
+        elif args.mode == 'open':
+            schedule = [('offered_rps', r) for r in args.rates]
+        else:
+            schedule = [('offered_rps', r) for r in np.linspace(args.rates[0], args.rates[-1], args.steps)]
+
+        # Warm up each endpoint (JIT compilation, model and cache loading)
+        for endpoint in args.mix:
+            client.send(*requests[endpoint])
+
+        print(f"{'step':<18} {'rps':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>8}")
+        for label, value in schedule:
+            if label == 'concurrency':
+                records, wall_time = run_closed_step(client, requests, args.mix, value, args.step_duration)
+            else:
+                records, wall_time = run_open_step(client, requests, args.mix, value, args.step_duration, args.max_workers)
+            step = summarize_step(label, float(value), records, wall_time)
+            steps.append(step)
+            print(f"{f'{label}={value:g}':<18} {step['throughput_rps']:8.2f} {step['p50_ms']:10.1f} "
+                  f"{step['p95_ms']:10.1f} {step['p99_ms']:10.1f} {step['error_rate']:8.1%}", flush=True)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    saturation = find_saturation(steps, args.slo_ms)
+    if saturation:
+        label = 'concurrency' if 'concurrency' in saturation else 'offered_rps'
+        print(f"\nSaturation at {label}={saturation[label]:g}: {saturation['throughput_rps']:.2f} req/s, "
+              f"p95 {saturation['p95_ms']:.0f} ms")
+    else:
+        print("\nNo saturation reached; extend the concurrency/rate range.")
+
+    with open(args.output, 'w') as f:
+        json.dump({'mode': args.mode, 'mix': args.mix, 'audio_duration': args.audio_duration,
+                   'steps': steps, 'saturation': saturation}, f, indent=2)
+    print(f"Results saved as: {args.output}")
+
+    if args.plot:
+        plot_curve(steps, args.plot)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+
+from distilled_model import DistilledModel
+from explanation_service import ExplanationService
+from ood_detector import OODDetector
+from tree_ensemble import FlatEnsemble
+
+DEFAULT_VERSION = 'default'  # the top-level parkinsons_model.pkl / feature_scaler.pkl
+ACTIVE_FILE = 'ACTIVE'       # models/ACTIVE holds the version to serve
+FLAT_ENSEMBLE_MAX_ROWS = 256  # above this, XGBoost's multithreaded predictor is faster
+
+class ModelBundle:
+    """
+    Everything served for one model version, loaded together so a swap is
+    all-or-nothing. With the trainer's parkinsons_model.npz (which carries the
+    scaler parameters), predictions need NumPy only: the pickled model and
+    scaler, and with them xgboost/sklearn, load on first use by explanations.
+    """
+
+    def __init__(self, version, directory, thread_budget=None):
+        self.version = version
+        self.directory = directory
+        self._thread_budget = thread_budget
+        self._model = self._scaler = None
+        self._pickle_lock = threading.Lock()
+
+        # Flattened copy written by the trainer: faster for small batches and
+        # needs neither sklearn nor xgboost at prediction time
+        ensemble_path = os.path.join(directory, 'parkinsons_model.npz')
+        self.ensemble = FlatEnsemble.load(ensemble_path) if os.path.exists(ensemble_path) else None
+        self._mean = self._scale = self._booster = None
+        if self.ensemble is not None and self.ensemble.scaler_mean is not None:
+            self._mean, self._scale = self.ensemble.scaler_mean, self.ensemble.scaler_scale
+            self.feature_names = list(self.ensemble.feature_names)
+            self.n_features = len(self._mean)
+        else:
+            self._load_pickles()
+            self.feature_names = list(getattr(self._scaler, 'feature_names_in_', []))
+            self.n_features = int(getattr(self._scaler, 'n_features_in_', len(self.feature_names)))
+            # Fast path for /predict: scaler.transform and XGBClassifier.predict_proba
+            # spend ~0.2 ms each on validation for a single row, so apply the fitted
+            # StandardScaler directly and call the booster in place.
+            if type(self._scaler).__name__ == 'StandardScaler':
+                self._mean = self._scaler.mean_ if self._scaler.mean_ is not None else 0.0
+                self._scale = self._scaler.scale_ if self._scaler.scale_ is not None else 1.0
+            if hasattr(self._model, 'get_booster'):
+                self._booster = self._model.get_booster()
+
+        self.distilled = DistilledModel.load(directory)  # fallback tier, when the trainer distilled one
+        # First stage of cascade mode: a small model on the cheap features only
+        cascade_path = os.path.join(directory, 'cascade_model.npz')
+        self.cascade = FlatEnsemble.load(cascade_path) if os.path.exists(cascade_path) else None
+        self.ood_detector = OODDetector.load(directory)
+        self.explanation_service = ExplanationService(lambda: self.model)
+
+    def _load_pickles(self):
+        with self._pickle_lock:
+            if self._model is None:
+                model = joblib.load(os.path.join(self.directory, 'parkinsons_model.pkl'))
+                if self._thread_budget:
+                    self._thread_budget.configure_model(model)  # trained with n_jobs=-1
+                self._scaler = joblib.load(os.path.join(self.directory, 'feature_scaler.pkl'))
+                self._model = model
+
+    @property
+    def model(self):
+        """The pickled model, for SHAP; loaded on first use when serving from the flat ensemble."""
+        self._load_pickles()
+        return self._model
+
+    @property
+    def scaler(self):
+        self._load_pickles()
+        return self._scaler
+
+    def scale(self, features_array):
+        if self._mean is None:
+            return self.scaler.transform(features_array)
+        return (features_array - self._mean) / self._scale
+
+    def predict(self, features_array, tier='full'):
+        """Returns (scaled features, predictions, class probabilities) for raw feature rows."""
+        features_scaled = self.scale(features_array)
+        probabilities = self.predict_proba(features_scaled, tier)
+        return features_scaled, probabilities.argmax(axis=1), probabilities
+
+    def predict_proba(self, features_scaled, tier='full'):
+        """Class probabilities from the full model, or from the distilled one when tier='distilled'."""
+        if tier == 'distilled' and self.distilled is not None:
+            return self.distilled.predict_proba(features_scaled)
+        if self.ensemble is not None and (self._booster is None or len(features_scaled) <= FLAT_ENSEMBLE_MAX_ROWS):
+            probabilities = self.ensemble.predict_proba(features_scaled)
+        elif self._booster is not None:
+            probabilities = self._booster.inplace_predict(features_scaled)
+            if probabilities.ndim == 1:  # binary:logistic returns P(class 1) only
+                probabilities = np.column_stack([1 - probabilities, probabilities])
+        else:
+            probabilities = self.model.predict_proba(features_scaled)
+        return probabilities
+
+class TierSelector:
+    """
+    Picks the model tier per request: for `endpoints` (None = all), the
+    distilled model answers while more than `max_queue_depth` scoring requests
+    are in flight in the request's lane, or while the endpoint's recent
+    latency (exponentially weighted) is over its budget. Either limit is off
+    when 0 / absent.
+    """
+
+    def __init__(self, max_queue_depth=0, latency_budgets=None, smoothing=0.2, endpoints=None):
+        self.max_queue_depth = max_queue_depth
+        self.latency_budgets = dict(latency_budgets or {})  # endpoint -> seconds
+        self.smoothing = smoothing
+        self.endpoints = set(endpoints) if endpoints is not None else None
+        self.in_flight = {}  # lane -> scoring requests
+        self.recent_latency = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_budgets(spec):
+        """'predict=50,extract=4000' (milliseconds) -> {'predict': 0.05, 'extract': 4.0}"""
+        budgets = {}
+        for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+            endpoint, _, milliseconds = item.partition('=')
+            budgets[endpoint.strip()] = float(milliseconds) / 1000
+        return budgets
+
+    @staticmethod
+    def parse_endpoints(spec):
+        """'predict,extract' -> {'predict', 'extract'}; an empty spec means none."""
+        return {part.strip() for part in (spec or '').split(',') if part.strip()}
+
+    def enter(self, lane='default'):
+        with self._lock:
+            self.in_flight[lane] = self.in_flight.get(lane, 0) + 1
+
+    def exit(self, lane='default', endpoint=None, seconds=None):
+        with self._lock:
+            self.in_flight[lane] -= 1
+            if endpoint is not None and seconds is not None:
+                previous = self.recent_latency.get(endpoint, seconds)
+                self.recent_latency[endpoint] = previous + self.smoothing * (seconds - previous)
+
+    def choose(self, endpoint, lane='default'):
+        if self.endpoints is not None and endpoint not in self.endpoints:
+            return 'full'
+        if self.max_queue_depth and self.in_flight.get(lane, 0) > self.max_queue_depth:
+            return 'distilled'
+        budget = self.latency_budgets.get(endpoint)
+        if budget and self.recent_latency.get(endpoint, 0) > budget:
+            return 'distilled'
+        return 'full'
+
+    def status(self):
+        return {
+            'in_flight': dict(self.in_flight),
+            'max_queue_depth': self.max_queue_depth,
+            'fallback_endpoints': sorted(self.endpoints) if self.endpoints is not None else 'all',
+            'latency_budgets_ms': {k: v * 1000 for k, v in self.latency_budgets.items()},
+            'recent_latency_ms': {k: round(v * 1000, 2) for k, v in self.recent_latency.items()}
+        }
+
+class ModelRegistry:
+    """
+    Versioned model artifacts under `root` (models/<version>/, as written by
+    train_parkinsons_model.py) plus the legacy top-level files as 'default'.
+
+    Requests read `registry.active` once and use that bundle throughout, so
+    activating another version swaps a single reference: in-flight requests
+    finish on the old model and new ones get the new model. An optional
+    shadow version scores the same features on a background thread and
+    divergences are logged.
+    """
+
+    def __init__(self, root='models', default_dir='.', shadow_log=None, divergence_threshold=0.1,
+                 max_shadow_backlog=100, thread_budget=None):
+        self.root = root
+        self.thread_budget = thread_budget
+        self.default_dir = default_dir
+        self.shadow_log = shadow_log
+        self.divergence_threshold = divergence_threshold
+        self.max_shadow_backlog = max_shadow_backlog
+        self.active = None
+        self.shadow = None
+        self.shadow_stats = {'agree': 0, 'diverged': 0, 'dropped': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._shadow_pending = 0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow-scoring')
+        self._active_file_mtime = self._active_file_changed_at()
+
+    def _active_file_changed_at(self):
+        try:
+            return os.path.getmtime(os.path.join(self.root, ACTIVE_FILE))
+        except OSError:
+            return None
+
+    def _directory(self, version):
+        return self.default_dir if version == DEFAULT_VERSION else os.path.join(self.root, version)
+
+    def versions(self):
+        """Available versions, oldest first, with 'default' first when present."""
+        versions = []
+        if os.path.exists(os.path.join(self.default_dir, 'parkinsons_model.pkl')):
+            versions.append(DEFAULT_VERSION)
+        if os.path.isdir(self.root):
+            versions.extend(sorted(
+                name for name in os.listdir(self.root)
+                if os.path.exists(os.path.join(self.root, name, 'parkinsons_model.pkl'))))
+        return versions
+
+    def pinned_version(self):
+        """Version named in models/ACTIVE, if any."""
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def load(self, version):
+        if version not in self.versions():
+            raise KeyError(version)
+        return ModelBundle(version, self._directory(version), self.thread_budget)
+
+    def activate(self, version):
+        """Loads `version` fully, then swaps it in. Raises KeyError for unknown versions."""
+        bundle = self.load(version)
+        with self._lock:
+            previous, self.active = self.active, bundle
+            if self.shadow and self.shadow.version == version:
+                self.shadow = None
+        print(f"✅ Serving model {version}" + (f" (was {previous.version})" if previous else ""))
+        return bundle
+
+    def set_shadow(self, version):
+        """Starts shadow-scoring with `version`, or stops it with None."""
+        bundle = self.load(version) if version else None
+        with self._lock:
+            self.shadow = bundle
+            self.shadow_stats = {'agree': 0, 'diverged': 0, 'dropped': 0, 'errors': 0}
+        print(f"Shadow model: {version or 'off'}")
+        return bundle
+
+    def refresh(self):
+        """Activates the version in models/ACTIVE when that file has changed since the last check."""
+        mtime = self._active_file_changed_at()
+        if mtime is None or mtime == self._active_file_mtime:
+            return False
+        self._active_file_mtime = mtime
+        version = self.pinned_version()
+        if not version or (self.active and self.active.version == version):
+            return False
+        try:
+            self.activate(version)
+            return True
+        except Exception as e:
+            print(f"❌ Could not activate model {version}: {e}")
+            return False
+
+    def watch(self, interval=5.0):
+        """Polls models/ACTIVE in a daemon thread so new versions go live without a restart."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+        threading.Thread(target=loop, name='model-watcher', daemon=True).start()
+
+    def score_shadow(self, features_array, primary_probabilities, primary_version, result_ids=None):
+        """
+        Queues the same raw feature rows for the shadow model. Never blocks the
+        caller; rows are dropped when the shadow backlog is full.
+        """
+        shadow = self.shadow
+        if shadow is None:
+            return
+        with self._lock:
+            if self._shadow_pending >= self.max_shadow_backlog:
+                self.shadow_stats['dropped'] += 1
+                return
+            self._shadow_pending += 1
+        self._shadow_executor.submit(self._score_shadow, shadow, np.array(features_array, copy=True),
+                                     np.asarray(primary_probabilities), primary_version, result_ids)
+
+    def _score_shadow(self, shadow, features_array, primary_probabilities, primary_version, result_ids):
+        try:
+            _, predictions, probabilities = shadow.predict(features_array)
+            difference = np.abs(probabilities[:, 1] - primary_probabilities[:, 1])
+            diverged = (predictions != primary_probabilities.argmax(axis=1)) | (difference > self.divergence_threshold)
+            with self._lock:
+                self.shadow_stats['diverged'] += int(diverged.sum())
+                self.shadow_stats['agree'] += int((~diverged).sum())
+            for i in np.flatnonzero(diverged):
+                record = {
+                    'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'result_id': result_ids[i] if result_ids else None,
+                    'primary_version': primary_version,
+                    'shadow_version': shadow.version,
+                    'primary_probability': float(primary_probabilities[i, 1]),
+                    'shadow_probability': float(probabilities[i, 1])
+                }
+                print(f"⚠️ Shadow divergence: {record}")
+                if self.shadow_log:
+                    with open(self.shadow_log, 'a') as f:
+                        f.write(json.dumps(record) + '\n')
+        except Exception as e:
+            with self._lock:
+                self.shadow_stats['errors'] += 1
+            print(f"Shadow scoring error ({shadow.version}): {e}")
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def status(self):
+        return {
+            'active': self.active.version if self.active else None,
+            'shadow': self.shadow.version if self.shadow else None,
+            'pinned': self.pinned_version(),
+            'versions': self.versions(),
+            'distilled': bool(self.active and self.active.distilled),
+            'shadow_stats': dict(self.shadow_stats)
+        }
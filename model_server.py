@@ -1,13 +1,32 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from pydub import AudioSegment
-import joblib
 import numpy as np
 import warnings
+import hmac
 import io
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import random
+from contextlib import ExitStack
+from datetime import datetime
 import librosa
-from audio_processor import analyze_audio_quality, butter_bandpass_filter, reduce_noise_spectral_gating, extract_features
-from result_export import generate_pdf_report, generate_csv_report
+from audio_processor import analyze_audio_quality, butter_bandpass_filter, reduce_noise_spectral_gating, extract_features, extract_cheap_features, select_analysis_window, select_voiced_segments, extract_display_features, PreprocessingPlanner
+from result_export import generate_pdf_report, generate_clinic_report, generate_pdf_archive, iter_csv_report, iter_parquet_report, PARQUET_AVAILABLE
+from model_registry import ModelRegistry, TierSelector, DEFAULT_VERSION
+from results_store import ResultsStore
+from metrics import Counter, Gauge, Histogram, REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, IN_FLIGHT, render_metrics, time_stage
+from profiling import RequestProfiler, RssTracker
+from thread_budget import ThreadBudget, available_cores
+from jobs import JobQueue, ProcessingError
+from scheduler import Scheduler, RequestShed
+from coalescing import Coalescer, request_key
+from explanation_service import ExplainerUnavailable
 
 # Suppress warnings for cleaner output
 warnings.filterwarnings('ignore')
@@ -15,24 +34,303 @@ warnings.filterwarnings('ignore')
 app = Flask(__name__)
 CORS(app)  # Enable Cross-Origin Resource Sharing
 
-# --- Load Model and Scaler ---
+# --- Memory budget for uploads ---
+MAX_UPLOAD_MB = float(os.environ.get('MAX_UPLOAD_MB', '25'))
+MAX_AUDIO_SECONDS = float(os.environ.get('MAX_AUDIO_SECONDS', '120'))  # decoded at most
+ANALYSIS_WINDOW_SECONDS = float(os.environ.get('ANALYSIS_WINDOW_SECONDS', '15'))  # 0 analyzes everything
+AUDIO_DTYPE = np.dtype(os.environ.get('AUDIO_DTYPE', 'float32'))  # 'float64' for the legacy double-precision path
+MAX_VOICED_SECONDS = float(os.environ.get('MAX_VOICED_SECONDS', '0'))  # cap on voiced audio sent to pyin/HPSS; 0 = no cap
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+# --- CPU thread budget ---
+# EXTRACTION_WORKERS recordings are processed at once; each gets an equal share
+# of this worker's cores for BLAS/OpenMP, and models predict with INFERENCE_THREADS.
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', available_cores()))
+thread_budget = ThreadBudget.from_env(concurrency=EXTRACTION_WORKERS).apply()
+print(f"Thread budget: {thread_budget.describe()}")
+# PDF batch exports share one pool of PDF_PROCESSES renderer processes (1 renders in-process)
+PDF_PROCESSES = int(os.environ.get('PDF_PROCESSES', thread_budget.worker_cores))
+
+# --- Model registry: versioned models, hot swap and shadow scoring ---
+# MODEL_VERSION pins a version at startup; otherwise models/ACTIVE, then the
+# top-level parkinsons_model.pkl/feature_scaler.pkl ('default').
+registry = ModelRegistry(os.environ.get('MODEL_DIR', 'models'), thread_budget=thread_budget,
+                         shadow_log=os.environ.get('SHADOW_LOG', 'shadow_divergence.jsonl'),
+                         divergence_threshold=float(os.environ.get('SHADOW_DIVERGENCE_THRESHOLD', '0.1')))
+MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN')
 try:
-    model = joblib.load('parkinsons_model.pkl')
-    scaler = joblib.load('feature_scaler.pkl')
-    print("✅ Model and scaler loaded successfully.")
-except FileNotFoundError:
-    model = None
-    scaler = None
-    print("❌ Error: parkinsons_model.pkl or feature_scaler.pkl not found.")
+    registry.activate(os.environ.get('MODEL_VERSION') or registry.pinned_version() or DEFAULT_VERSION)
+    if os.environ.get('SHADOW_MODEL_VERSION'):
+        registry.set_shadow(os.environ['SHADOW_MODEL_VERSION'])
+except (KeyError, FileNotFoundError) as e:
+    print(f"❌ Error: model files not found ({e}).")
     print("Please run train_parkinsons_model.py to generate the model files.")
+if registry.active and registry.active.ood_detector is None:
+    print("⚠️ No training statistics found; OOD detection disabled.")
+registry.watch(float(os.environ.get('MODEL_RELOAD_INTERVAL', '5')))
+
+# --- Distilled fallback tier ---
+# On FALLBACK_ENDPOINTS (default "predict"), the distilled model answers while
+# more than FALLBACK_QUEUE_DEPTH scoring requests are in flight in the request's
+# scheduler lane (0 = never), or while the endpoint's recent latency is over its
+# FALLBACK_LATENCY_BUDGETS_MS entry, e.g. "predict=50". On the audio endpoints
+# the tree ensemble takes microseconds next to seconds of DSP, so falling back
+# there only costs accuracy; list them in FALLBACK_ENDPOINTS to allow it anyway.
+SCORING_ENDPOINTS = {'process_and_predict', 'predict', 'extract'}
+tier_selector = TierSelector(
+    max_queue_depth=int(os.environ.get('FALLBACK_QUEUE_DEPTH', 2 * EXTRACTION_WORKERS)),
+    latency_budgets=TierSelector.parse_budgets(os.environ.get('FALLBACK_LATENCY_BUDGETS_MS')),
+    endpoints=TierSelector.parse_endpoints(os.environ.get('FALLBACK_ENDPOINTS', 'predict')))
+MODEL_TIERS = Counter('parkinsons_model_tier_total', 'Predictions answered by each model tier.', ('endpoint', 'tier'))
+
+# --- Out-of-distribution detection ---
+# OOD_MODE=flag reports the score only; OOD_MODE=reject refuses to predict.
+OOD_MODE = os.environ.get('OOD_MODE', 'flag')
+
+# --- Adaptive pre-processing ---
+# Spectral gating and trimming are skipped for recordings whose measured SNR is
+# at least PREPROCESS_SKIP_SNR dB (0 = always run them). Validate a threshold
+# with: python benchmark_pipeline.py --check-plan --skip-snr <dB> (35 passes; 30 does not)
+PREPROCESS_SKIP_SNR = float(os.environ.get('PREPROCESS_SKIP_SNR', '35'))
+preprocessing_planner = PreprocessingPlanner(PREPROCESS_SKIP_SNR or None)
+PREPROCESSING_SAVED = Counter('parkinsons_preprocessing_saved_seconds_total',
+                              'Estimated time saved by skipped pre-processing steps.')
+
+# --- Cascade mode for /process_and_predict ---
+# CASCADE_MODE=1: YIN pitch and RMS shimmer go through cascade_model.npz first, and
+# its answer is returned when its confidence reaches CASCADE_CONFIDENCE on a
+# recording with a measured SNR of at least CASCADE_MIN_SNR dB. Otherwise
+# denoising, pyin, HPSS and the full model run as usual. Cascade answers have no
+# OOD check (it needs all 15 features), so OOD_MODE=reject turns the cascade off.
+CASCADE_MODE = os.environ.get('CASCADE_MODE', '0') == '1'
+CASCADE_CONFIDENCE = float(os.environ.get('CASCADE_CONFIDENCE', '0.9'))
+CASCADE_MIN_SNR = float(os.environ.get('CASCADE_MIN_SNR', '20'))
+CASCADE_SECONDS = Histogram('parkinsons_cascade_seconds',
+                            'Feature extraction and prediction time by the cascade stage that answered.', ['stage'])
+
+# --- Server-side analysis history ---
+results_store = ResultsStore(os.environ.get('RESULTS_DB', 'results.db'))
+
+# --- Metrics read at scrape time ---
+Gauge('parkinsons_results_write_queue', 'Results waiting to be written to the results store.',
+      function=results_store.pending)
+
+def _explanation_stat(name):
+    service = registry.active.explanation_service if registry.active else None
+    return getattr(service, name, 0)
+
+Counter('parkinsons_explanation_cache_hits_total', 'SHAP explanations served from cache (active model).',
+        function=lambda: _explanation_stat('hits'))
+Counter('parkinsons_explanation_cache_misses_total', 'SHAP explanations computed (active model).',
+        function=lambda: _explanation_stat('misses'))
+Counter('parkinsons_shadow_divergences_total', 'Shadow model scores that diverged from the active model.',
+        function=lambda: registry.shadow_stats['diverged'])
+
+def endpoint_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.in_flight_endpoint = endpoint_label()
+    IN_FLIGHT.inc(endpoint=g.in_flight_endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = endpoint_label()
+    code = g.get('error_code') or ('OK' if response.status_code < 400 else 'ERROR')
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code, code=code)
+    if 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'in_flight_endpoint' in g:
+        IN_FLIGHT.dec(endpoint=g.in_flight_endpoint)
+
+@app.before_request
+def track_scoring_load():
+    if request.endpoint in SCORING_ENDPOINTS:
+        tier_selector.enter(request_lane(request.endpoint))
+        g.scoring_endpoint = request.endpoint
+
+@app.after_request
+def record_scoring_latency(response):
+    if 'scoring_endpoint' in g and response.status_code < 400:
+        g.scoring_seconds = time.perf_counter() - g.request_start
+    return response
+
+@app.teardown_request
+def finish_scoring_load(exc):
+    endpoint = g.pop('scoring_endpoint', None)
+    if endpoint:
+        tier_selector.exit(request_lane(endpoint), endpoint, g.pop('scoring_seconds', None))
+
+def request_lane(endpoint):
+    """The scheduler lane an endpoint runs in; async jobs ('jobs') share the analysis lane."""
+    return REQUEST_LANES.get(endpoint, 'analysis')
+
+def choose_tier(bundle, endpoint=None):
+    """'distilled' when the server is over its load limits and the model has a distilled tier, else 'full'."""
+    endpoint = endpoint or request.endpoint
+    tier = tier_selector.choose(endpoint, request_lane(endpoint)) if bundle.distilled else 'full'
+    MODEL_TIERS.inc(endpoint=endpoint, tier=tier)
+    return tier
+
+# --- Opt-in request profiling ---
+# Set PROFILE_SAMPLE_RATE (0-1) to profile pipeline requests. "X-Profile: 1" asks
+# for a profile of one request; it is honored with PROFILE_HEADER=1 or a valid
+# X-Admin-Token. Only the newest PROFILE_MAX_FILES profiles are kept.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_HEADER = os.environ.get('PROFILE_HEADER', '0') == '1'
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '100'))
+PROFILED_ENDPOINTS = {'process_and_predict'}
+
+def make_stage_timer(profiler=None, memory=None):
+    """
+    Returns a stage timer feeding /metrics, plus the request profiler and an
+    RssTracker (sampled as each stage ends) when given.
+    """
+    if profiler is None and memory is None:
+        return time_stage
+
+    def timer(stage):
+        stack = ExitStack()
+        if memory:
+            stack.callback(memory.sample)
+        stack.enter_context(time_stage(stage))
+        if profiler:
+            stack.enter_context(profiler.stage(stage))
+        return stack
+    return timer
+
+@app.before_request
+def start_profiler():
+    if request.endpoint not in PROFILED_ENDPOINTS:
+        return
+    requested = request.headers.get('X-Profile') == '1' and (PROFILE_HEADER or has_admin_token())
+    if requested or random.random() < PROFILE_SAMPLE_RATE:
+        g.profiler = RequestProfiler.start(request.endpoint)
+
+@app.after_request
+def stop_profiler(response):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        response.headers['X-Profile-Id'] = profiler.stop(PROFILE_DIR, PROFILE_MAX_FILES)
+    return response
+
+@app.teardown_request
+def discard_profiler(exc):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        profiler.stop(PROFILE_DIR, PROFILE_MAX_FILES)
+
+# --- Request scheduling: priority lanes, deadlines and per-client limits ---
+# Each lane runs at most LANE_CONCURRENCY requests at once (e.g.
+# "interactive=4,analysis=2,export=1"), and a lane starts nothing while a
+# higher-priority lane has requests queued, so mic checks never wait behind
+# analyses or PDF exports. At most LANE_QUEUE_LIMIT requests wait per lane; more
+# are shed (503 LANE_QUEUE_FULL). Waiting requests hold a server thread, so
+# waitress gets enough threads for every lane's running and queued requests,
+# MAX_EVENT_STREAMS job streams and UNSCHEDULED_THREADS for other endpoints
+# (SERVER_THREADS overrides this).
+# X-Deadline-Ms is how long the client will wait:
+# requests still queued past it are shed (503 DEADLINE_EXCEEDED) and analyses
+# stop at the next stage. MAX_REQUESTS_PER_CLIENT (default 0 = no limit) caps the
+# scheduled requests in progress per client (429): per remote address, or, for
+# requests from TRUSTED_PROXIES (the Next.js server), per X-Client-Id/X-User-Id.
+# Proxied requests without either header are not limited, so users behind the
+# proxy never share one limit.
+REQUEST_LANES = {'test_mic': 'interactive', 'predict': 'interactive', 'explain': 'interactive',
+                 'process_and_predict': 'analysis', 'extract': 'analysis', 'export_report': 'export'}
+LANE_CONCURRENCY = Scheduler.parse_lane_values(os.environ.get('LANE_CONCURRENCY'),
+                                               {'interactive': 4, 'analysis': EXTRACTION_WORKERS, 'export': 1})
+LANE_QUEUE_LIMIT = Scheduler.parse_lane_values(os.environ.get('LANE_QUEUE_LIMIT'),
+                                               {'interactive': 8, 'analysis': 2 * EXTRACTION_WORKERS, 'export': 2},
+                                               minimum=0)
+UNSCHEDULED_THREADS = int(os.environ.get('UNSCHEDULED_THREADS', '8'))  # /metrics, /jobs polling, /models, ...
+LANE_REQUESTS = Gauge('parkinsons_lane_requests', 'Requests waiting for or running in each scheduler lane.',
+                      ('lane', 'state'))
+scheduler = Scheduler({lane: {'priority': priority, 'concurrency': LANE_CONCURRENCY[lane],
+                              'max_queued': LANE_QUEUE_LIMIT[lane]}
+                       for priority, lane in enumerate(('interactive', 'analysis', 'export'))},
+                      per_client_limit=int(os.environ.get('MAX_REQUESTS_PER_CLIENT', '0')), gauge=LANE_REQUESTS)
+TRUSTED_PROXIES = {address.strip() for address in os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1').split(',')}
+SHED_REQUESTS = Counter('parkinsons_shed_requests_total', 'Requests shed by the scheduler.', ('lane', 'code'))
+
+def request_client():
+    """The key the per-client limit counts by, or None for unidentified requests from a trusted proxy."""
+    if request.remote_addr in TRUSTED_PROXIES:
+        return request.headers.get('X-Client-Id') or request.headers.get('X-User-Id')
+    return request.remote_addr
+
+@app.before_request
+def schedule_request():
+    lane = REQUEST_LANES.get(request.endpoint)
+    if lane is None:
+        return None
+    deadline = None
+    if request.headers.get('X-Deadline-Ms'):
+        try:
+            deadline = time.monotonic() + float(request.headers['X-Deadline-Ms']) / 1000
+        except ValueError:
+            return make_error_response('X-Deadline-Ms must be a number of milliseconds.', 'INVALID_DEADLINE', 400)
+    g.deadline = deadline
+    if request_coalesces():
+        return None  # only the duplicate that computes the result takes a slot (see process_and_predict)
+    try:
+        take_lane_slot(lane)
+    except RequestShed as e:
+        return make_error_response(e.message, e.code, e.status_code)
+
+def take_lane_slot(lane):
+    """Waits for this request's slot in `lane`; the teardown releases it. Raises RequestShed."""
+    client = request_client()
+    try:
+        g.queue_seconds = scheduler.acquire(lane, client, g.get('deadline'))
+    except RequestShed as e:
+        SHED_REQUESTS.inc(lane=lane, code=e.code)
+        raise
+    STAGE_SECONDS.observe(g.queue_seconds, stage=f'{lane}_queue')
+    g.lane, g.client = lane, client
+
+@app.teardown_request
+def release_request_slot(exc):
+    lane = g.pop('lane', None)
+    if lane:
+        scheduler.release(lane, g.pop('client', None))
+
+def deadline_timer(timer, deadline):
+    """Wraps a stage timer so no stage starts once the request's deadline has passed."""
+    if deadline is None:
+        return timer
+
+    def checked(stage):
+        if time.monotonic() >= deadline:
+            SHED_REQUESTS.inc(lane=g.get('lane', 'none'), code='DEADLINE_EXCEEDED')
+            raise ProcessingError('Request deadline passed before processing finished.', 'DEADLINE_EXCEEDED', 503)
+        return timer(stage)
+    return checked
 
-def make_error_response(message, code, status_code):
+def make_error_response(message, code, status_code, details=None):
     """Helper to create a structured error response."""
-    return jsonify({
-        'error': {
-            'code': code,
-            'message': message
-        }}), status_code
+    g.error_code = code
+    error = {
+        'code': code,
+        'message': message
+    }
+    if details:
+        error.update(details)
+    return jsonify({'error': error}), status_code
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    if request.is_json:  # /predict feature batches, /export histories
+        return make_error_response(f'Request body too large. Maximum size is {MAX_UPLOAD_MB:g} MB.',
+                                   'REQUEST_TOO_LARGE', 413)
+    return make_error_response(f'Audio file too large. Maximum size is {MAX_UPLOAD_MB:g} MB.', 'AUDIO_TOO_LARGE', 413)
 
 @app.route('/test_mic', methods=['POST'])
 def test_mic():
@@ -42,86 +340,735 @@ def test_mic():
     file = request.files['audio']
     audio_bytes = file.read()
     try:
-        y, sr = librosa.load(io.BytesIO(audio_bytes), sr=22050)
+        with time_stage('decode'):
+            y, sr = librosa.load(io.BytesIO(audio_bytes), sr=22050, duration=MAX_AUDIO_SECONDS)
     except Exception as e:
         return jsonify({'error': f'Could not process audio file: {e}'}), 400
 
     # --- Quality Checks ---
-    quality_report = analyze_audio_quality(y, sr)
+    with time_stage('quality_check'):
+        quality_report = analyze_audio_quality(y, sr)
     if quality_report['warnings']:
         return jsonify({'error': '. '.join(quality_report['warnings'])}), 400
 
     return jsonify({
         'status': 'ok',
         'message': 'Microphone quality is good.',
-        'quality_score': quality_report['quality_score'],
-        'snr': quality_report['snr'],
-        'amplitude': quality_report['amplitude']
+        'quality_score': float(quality_report['quality_score']),
+        'snr': float(quality_report['snr']),
+        'amplitude': float(quality_report['amplitude'])
     })
 
+def run_feature_pipeline(y, sr, timer=time_stage, extras=None, early_exit=None, plan=None):
+    """
+    Pre-processing and feature extraction shared by /process_and_predict and
+    /extract, for a signal that already passed the quality check.
+    Returns (15 features, {'analyzed_seconds', 'voiced_seconds'}).
+
+    `plan` comes from preprocessing_planner.plan(quality_report); steps it
+    marks False are skipped, and the plan is logged with the time saved.
+
+    With `early_exit`, the cheap features of the band-passed signal are passed
+    to it first; if it returns True the pipeline stops there and returns
+    (None, durations).
+    """
+    # --- Analyze only the most stable voiced window of long recordings ---
+    with timer('window'):
+        y, _ = select_analysis_window(y, sr, ANALYSIS_WINDOW_SECONDS)
+    analyzed_seconds = len(y) / sr
+
+    # --- Pre-processing Pipeline ---
+    # Each step replaces y so the previous array is released right away
+    with timer('bandpass'):
+        y = butter_bandpass_filter(y, 300, 1500, sr)
+
+    # --- Cascade first stage: no denoising, YIN instead of pyin, no HPSS ---
+    if early_exit is not None:
+        with timer('cheap_features'):
+            voiced, _ = librosa.effects.trim(y, top_db=20)
+            voiced = select_voiced_segments(voiced, sr, top_db=20, max_seconds=MAX_VOICED_SECONDS or None)
+            cheap_features = extract_cheap_features(voiced, sr, timer=timer)
+        if early_exit(cheap_features):
+            return None, {'analyzed_seconds': analyzed_seconds, 'voiced_seconds': len(voiced) / sr}
+        del voiced
+
+    plan = plan or dict.fromkeys(('denoise', 'trim'), True)
+    if plan['denoise']:
+        start = time.perf_counter()
+        with timer('denoise'):
+            y = reduce_noise_spectral_gating(y, sr)
+        preprocessing_planner.record('denoise', time.perf_counter() - start, analyzed_seconds)
+    if plan['trim']:
+        start = time.perf_counter()
+        with timer('trim'):
+            y, _ = librosa.effects.trim(y, top_db=20)
+        preprocessing_planner.record('trim', time.perf_counter() - start, analyzed_seconds)
+    skipped = [step for step, run in plan.items() if not run]
+    if skipped:
+        saved_seconds = preprocessing_planner.saved_seconds(plan, analyzed_seconds)
+        PREPROCESSING_SAVED.inc(saved_seconds)
+        saved = f" (~{saved_seconds * 1000:.0f} ms saved)" if saved_seconds else ""
+        print(f"Preprocessing plan: skipped {', '.join(skipped)}{saved}")
+    else:
+        print("Preprocessing plan: all steps")
+
+    # --- Feature Extraction on sustained phonation only ---
+    with timer('voiced_segments'):
+        y = select_voiced_segments(y, sr, top_db=20, max_seconds=MAX_VOICED_SECONDS or None)
+    features = extract_features(y, sr, timer=timer, extras=extras)
+    if extras is not None:
+        extras.update(extract_display_features(y, sr))
+    return features, {'analyzed_seconds': analyzed_seconds, 'voiced_seconds': len(y) / sr}
+
+def prediction_result(bundle, probability, tier, result_id, ood_report, input_seconds, durations, memory,
+                      quality_report, plan):
+    """The /process_and_predict response body for one recording's class probabilities."""
+    prediction = int(probability.argmax())
+    return {
+        'prediction': prediction,
+        'confidence': float(probability[prediction] * 100),
+        'result_id': result_id,
+        'model_version': bundle.version,
+        'model_tier': tier,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'ood': ood_report,
+        'resources': {
+            'input_seconds': round(input_seconds, 2),
+            'analyzed_seconds': round(durations['analyzed_seconds'], 2),
+            'voiced_seconds': round(durations['voiced_seconds'], 2),
+            'skipped_steps': [step for step, run in plan.items() if not run],
+            'peak_rss_mb': memory.peak_mb
+        },
+        'quality_report': {
+            'warnings': quality_report['warnings'],
+            'quality_score': float(quality_report['quality_score']),
+            'snr': float(quality_report['snr']),
+            'amplitude': float(quality_report['amplitude'])
+        }
+    }
+
+def cascade_early_exit(bundle, answer):
+    """
+    Returns the cascade's first-stage check for run_feature_pipeline: True
+    when the cheap model is confident enough, with its probabilities stored
+    in answer['probabilities'].
+    """
+    def early_exit(cheap_features):
+        with time_stage('cascade_predict'):
+            probabilities = bundle.cascade.predict_proba(bundle.cascade.scale(cheap_features))
+        answer['probabilities'] = probabilities
+        return bool(probabilities.max() >= CASCADE_CONFIDENCE)
+    return early_exit
+
+# Job progress stages, from the pipeline stage that starts each one
+PROGRESS_STAGES = {'decode': 'decode', 'quality_check': 'quality', 'bandpass': 'denoise',
+                   'voiced_segments': 'features', 'cheap_features': 'features', 'scale': 'predict'}
+
+def progress_timer(timer, progress):
+    """Wraps a stage timer so entering a pipeline stage also reports job progress."""
+    def timed(stage):
+        progress(PROGRESS_STAGES.get(stage))
+        return timer(stage)
+    return timed
+
+def analyze_recording(bundle, audio_bytes, language, user_id, timer, memory, endpoint):
+    """
+    Decode, quality check, pre-processing, features and prediction for one
+    uploaded recording; shared by /process_and_predict and /jobs. Returns the
+    stored result, or raises ProcessingError for client-facing failures.
+    """
+    print(f"Processing request for language: {language}")
+
+    # Convert audio from whatever format it is (e.g., webm) to WAV,
+    # decoding at most MAX_AUDIO_SECONDS
+    with timer('decode'):
+        audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes), duration=MAX_AUDIO_SECONDS)
+        wav_bytes = io.BytesIO()
+        audio_segment.export(wav_bytes, format="wav")
+        del audio_segment
+        wav_bytes.seek(0)
+        y, sr = librosa.load(wav_bytes, sr=22050, dtype=AUDIO_DTYPE)
+        del wav_bytes
+    input_seconds = len(y) / sr
+
+    # --- Quality Check before processing ---
+    with timer('quality_check'):
+        quality_report = analyze_audio_quality(y, sr)
+    if quality_report['warnings']:
+        raise ProcessingError('. '.join(quality_report['warnings']), 'POOR_AUDIO_QUALITY', 400)
+
+    plan = preprocessing_planner.plan(quality_report)
+    # A defaulted SNR (no pauses to measure noise in) is often the noisiest audio
+    use_cascade = (CASCADE_MODE and bundle.cascade is not None and OOD_MODE != 'reject'
+                   and quality_report['snr_measured'] and quality_report['snr'] >= CASCADE_MIN_SNR)
+    cascade_answer = {}
+    pipeline_start = time.perf_counter()
+    features, durations = run_feature_pipeline(
+        y, sr, timer, early_exit=cascade_early_exit(bundle, cascade_answer) if use_cascade else None, plan=plan)
+    del y
+    if features is None:
+        CASCADE_SECONDS.observe(time.perf_counter() - pipeline_start, stage='cheap')
+        MODEL_TIERS.inc(endpoint=endpoint, tier='cascade')
+        probability = cascade_answer['probabilities'][0]
+        result = prediction_result(bundle, probability, 'cascade', None, None,
+                                   input_seconds, durations, memory, quality_report, plan)
+        results_store.add({**result, 'user_id': user_id, 'language': language})
+        return result
+    features_array = np.array(features).reshape(1, -1)
+
+    # --- Prediction ---
+    with timer('scale'):
+        features_scaled = bundle.scale(features_array)
+
+    ood_report = None
+    if bundle.ood_detector:
+        ood_scores, ood_flags = bundle.ood_detector.check(features_scaled)
+        ood_report = {
+            'score': float(ood_scores[0]),
+            'threshold': bundle.ood_detector.threshold,
+            'out_of_distribution': bool(ood_flags[0])
+        }
+        if OOD_MODE == 'reject' and ood_flags[0]:
+            raise ProcessingError(
+                'This recording differs too much from the training data for a reliable result. Please record again.',
+                'OUT_OF_DISTRIBUTION', 422, {'ood': ood_report})
+
+    tier = choose_tier(bundle, endpoint)
+    with timer('predict'):
+        probability = bundle.predict_proba(features_scaled, tier)[0]
+
+    # Keep the scaled row so /explain can reuse it without re-extraction
+    explanation_service = bundle.explanation_service
+    result_id = explanation_service.register(features_scaled)[0] if explanation_service else None
+    if tier == 'full':
+        registry.score_shadow(features_array, probability.reshape(1, -1), bundle.version, [result_id])
+    if use_cascade:
+        CASCADE_SECONDS.observe(time.perf_counter() - pipeline_start, stage='full')
+
+    result = prediction_result(bundle, probability, tier, result_id, ood_report,
+                               input_seconds, durations, memory, quality_report, plan)
+    results_store.add({**result, 'user_id': user_id, 'language': language})
+    return result
+
+# --- Coalescing duplicate uploads ---
+# Overlapping /process_and_predict requests with the same audio, language, user
+# and model (browser retries, double clicks) share one computation: threads wait
+# for the first, other worker processes wait on its lock file in COALESCE_DIR.
+# Only requests that arrive while it runs share its result; nothing is cached.
+# COALESCE_REQUESTS=0 turns this off, and "Cache-Control: no-coalesce" opts a
+# request out (benchmarks that send the same recording on purpose).
+# Duplicates join the in-flight request before lane admission, so only the one
+# that computes the result holds an analysis slot or counts toward the queue.
+COALESCE_REQUESTS = os.environ.get('COALESCE_REQUESTS', '1') == '1'
+coalescer = Coalescer(os.environ.get('COALESCE_DIR', os.path.join(tempfile.gettempdir(), 'parkinsons-inflight')))
+Counter('parkinsons_coalesced_requests_total', 'Duplicate requests answered with a result computed for another.',
+        function=lambda: sum(coalescer.stats.values()))
+
+def request_coalesces():
+    return (COALESCE_REQUESTS and request.endpoint == 'process_and_predict'
+            and 'no-coalesce' not in request.headers.get('Cache-Control', ''))
+
 @app.route('/process_and_predict', methods=['POST'])
 def process_and_predict():
-    if not model or not scaler:
+    bundle = registry.active  # held for the whole request, across hot swaps
+    if bundle is None:
         return make_error_response('Model not loaded. Please contact support.', 'MODEL_NOT_FOUND', 500)
 
     try:
         if 'audio' not in request.files:
             return make_error_response('No audio file provided.', 'NO_AUDIO_FILE', 400)
         
-        file = request.files['audio']
+        memory = RssTracker()
+        timer = deadline_timer(make_stage_timer(g.get('profiler'), memory), g.get('deadline'))
         language = request.form.get('language', 'en')
-        print(f"Processing request for language: {language}")
+        user_id = request.form.get('user_id') or request.headers.get('X-User-Id')
+        audio_bytes = request.files['audio'].read()
 
-        audio_bytes = file.read()
+        def analyze():
+            if 'lane' not in g:  # coalescing deferred the slot to whichever duplicate computes
+                take_lane_slot(request_lane(request.endpoint))
+            return analyze_recording(bundle, audio_bytes, language, user_id, timer, memory, request.endpoint)
 
-        # Convert audio from whatever format it is (e.g., webm) to WAV
-        audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes))
-        wav_bytes = io.BytesIO()
-        audio_segment.export(wav_bytes, format="wav")
-        wav_bytes.seek(0)
-        y, sr = librosa.load(wav_bytes, sr=22050)
+        if not request_coalesces():
+            return jsonify(analyze())
+        result, shared = coalescer.run(request_key(audio_bytes, language, user_id, bundle.version), analyze)
+        response = jsonify(result)
+        if shared:
+            response.headers['X-Coalesced'] = shared
+        return response
 
-        # --- Quality Check before processing ---
-        quality_report = analyze_audio_quality(y, sr)
-        if quality_report['warnings']:
-            return make_error_response('. '.join(quality_report['warnings']), 'POOR_AUDIO_QUALITY', 400)
+    except ProcessingError as e:
+        return make_error_response(e.message, e.code, e.status_code, e.details)
+    except RequestShed as e:  # the computing duplicate was shed; its waiters share the answer
+        return make_error_response(e.message, e.code, e.status_code)
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        print(f"Prediction error: {e}")
+        return make_error_response('An unexpected error occurred during prediction.', 'PREDICTION_FAILED', 500)
+
+# --- Async jobs: submit, then poll or stream progress ---
+# Jobs run on JOB_WORKERS background threads (default EXTRACTION_WORKERS);
+# finished results are kept for JOB_RESULT_TTL seconds.
+job_queue = JobQueue(workers=int(os.environ.get('JOB_WORKERS', EXTRACTION_WORKERS)),
+                     ttl=float(os.environ.get('JOB_RESULT_TTL', '300')),
+                     max_pending=int(os.environ.get('MAX_PENDING_JOBS', '100')))
+Gauge('parkinsons_jobs_pending', 'Async jobs queued or running.', function=job_queue.pending)
+# An event stream holds a server thread until its job finishes, so at most
+# MAX_EVENT_STREAMS are open at once (503 STREAM_LIMIT beyond; poll instead).
+# They get threads of their own in the default SERVER_THREADS.
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', '4'))
+event_streams = threading.BoundedSemaphore(MAX_EVENT_STREAMS) if MAX_EVENT_STREAMS > 0 else None
+EVENT_STREAMS = Gauge('parkinsons_event_streams', 'Open /jobs/<id>/events streams.')
+JOB_PROGRESS = ('decode', 'quality', 'denoise', 'features', 'predict')
+
+def run_analysis_job(progress, bundle, audio_bytes, language, user_id):
+    tier_selector.enter('analysis')
+    start = time.perf_counter()
+    # Jobs share the analysis lane; they wait on a job worker, not a server thread, so the queue limit is not theirs
+    STAGE_SECONDS.observe(scheduler.acquire('analysis', bounded=False), stage='analysis_queue')
+    try:
+        memory = RssTracker()
+        result = analyze_recording(bundle, audio_bytes, language, user_id,
+                                   progress_timer(make_stage_timer(memory=memory), progress), memory, 'jobs')
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='jobs')
+        return result
+    finally:
+        scheduler.release('analysis')
+        tier_selector.exit('analysis', 'jobs', time.perf_counter() - start)
+
+def job_view(job):
+    """Public fields of a job snapshot."""
+    view = {key: job[key] for key in ('job_id', 'status', 'stage', 'stages', 'submitted_at', 'finished_at')}
+    if job['status'] == 'done':
+        view['result'] = job['result']
+    elif job['status'] == 'failed':
+        view['error'] = job['error']
+    return view
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Same form fields as /process_and_predict. Returns 202 with a job id right
+    away; poll GET /jobs/<id> or stream GET /jobs/<id>/events for the result.
+    """
+    bundle = registry.active
+    if bundle is None:
+        return make_error_response('Model not loaded. Please contact support.', 'MODEL_NOT_FOUND', 500)
+    if 'audio' not in request.files:
+        return make_error_response('No audio file provided.', 'NO_AUDIO_FILE', 400)
+    job_id = job_queue.submit(run_analysis_job, bundle, request.files['audio'].read(),
+                              request.form.get('language', 'en'),
+                              request.form.get('user_id') or request.headers.get('X-User-Id'))
+    if job_id is None:
+        return make_error_response('Too many jobs in progress. Please try again shortly.', 'JOB_QUEUE_FULL', 503)
+    response = jsonify({'job_id': job_id, 'status': 'queued', 'progress_stages': JOB_PROGRESS,
+                        'status_url': f'/jobs/{job_id}', 'events_url': f'/jobs/{job_id}/events'})
+    response.status_code = 202
+    response.headers['Location'] = f'/jobs/{job_id}'
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return make_error_response('Unknown or expired job.', 'JOB_NOT_FOUND', 404)
+    return jsonify(job_view(job))
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent events: a 'stage' event as each stage starts, then one
+    'result' or 'error' event. Comments are sent every 15 s to keep proxies
+    from closing the stream.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return make_error_response('Unknown or expired job.', 'JOB_NOT_FOUND', 404)
+    if event_streams is None or not event_streams.acquire(blocking=False):
+        return make_error_response(f'Too many open event streams; poll /jobs/{job_id} instead.', 'STREAM_LIMIT', 503)
+    EVENT_STREAMS.inc()
+
+    def close_stream():
+        EVENT_STREAMS.dec()
+        event_streams.release()
+
+    def events(job):
+        sent_stages = 0
+        while True:
+            for stage in job['stages'][sent_stages:]:
+                yield f"event: stage\ndata: {json.dumps({'stage': stage})}\n\n"
+            sent_stages = len(job['stages'])
+            if job['status'] == 'done':
+                yield f"event: result\ndata: {json.dumps(job['result'])}\n\n"
+                return
+            if job['status'] == 'failed':
+                yield f"event: error\ndata: {json.dumps(job['error'])}\n\n"
+                return
+            version = job['version']
+            job = job_queue.wait(job_id, version, timeout=15)
+            if job is None:
+                return
+            if job['version'] == version:
+                yield ": keep-alive\n\n"
 
-        # --- Pre-processing Pipeline ---
-        y_filtered = butter_bandpass_filter(y, 300, 1500, sr)
-        y_denoised = reduce_noise_spectral_gating(y_filtered, sr)
-        y_trimmed, _ = librosa.effects.trim(y_denoised, top_db=20)
+    response = Response(stream_with_context(events(job)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close_stream)  # when the stream ends or the client goes away
+    return response
 
-        # --- Feature Extraction ---
-        features = extract_features(y_trimmed, sr)
-        features_array = np.array(features).reshape(1, -1)
+def parse_feature_matrix(bundle):
+    """
+    Reads feature rows from the request body as a float64 (n, n_features) array.
+    JSON: {"features": [...]} with one vector or a list of vectors.
+    application/octet-stream: raw little-endian float64 rows, read without copying.
+    Returns (array, single vector given).
+    """
+    if request.mimetype == 'application/octet-stream':
+        data = np.frombuffer(request.get_data(cache=False), dtype='<f8')
+        if data.size == 0 or data.size % bundle.n_features:
+            raise ValueError(f'body must hold a multiple of {bundle.n_features} float64 values')
+        features_array, single = data.reshape(-1, bundle.n_features), False
+    else:
+        payload = request.get_json(silent=True)
+        features = payload.get('features') if isinstance(payload, dict) else payload
+        if features is None:
+            raise ValueError('no features provided')
+        features_array = np.asarray(features, dtype=np.float64)
+        single = features_array.ndim == 1
+        features_array = np.atleast_2d(features_array)
 
-        # --- Prediction ---
-        features_scaled = scaler.transform(features_array)
-        prediction = model.predict(features_scaled)[0]
-        probability = model.predict_proba(features_scaled)[0]
-        confidence = probability[int(prediction)] * 100
+    # Same checks for both encodings; NaN/Inf would otherwise reach the model silently
+    if features_array.ndim != 2 or features_array.shape[1] != bundle.n_features or not len(features_array):
+        raise ValueError(f'expected {bundle.n_features} values per vector, got shape {features_array.shape}')
+    if not np.isfinite(features_array).all():
+        raise ValueError('features must be finite numbers')
+    return features_array, single
 
+@app.route('/predict', methods=['POST'])
+def predict():
+    """
+    Features in, prediction out, with no audio processing. Used by the
+    Next.js /api/predict route; accepts one vector or a matrix of vectors.
+    """
+    bundle = registry.active
+    if bundle is None:
+        return make_error_response('Model not loaded. Please contact support.', 'MODEL_NOT_FOUND', 500)
+    try:
+        features_array, single = parse_feature_matrix(bundle)
+    except (ValueError, TypeError) as e:
+        return make_error_response(f'Invalid features: {e}', 'INVALID_FEATURES', 400)
+
+    with time_stage('scale'):
+        features_scaled = bundle.scale(features_array)
+    # Caller-supplied vectors get the same OOD check as extracted ones, per row
+    ood_report = None
+    if bundle.ood_detector:
+        ood_scores, ood_flags = bundle.ood_detector.check(features_scaled)
+        if single:
+            ood_report = {'score': float(ood_scores[0]), 'threshold': bundle.ood_detector.threshold,
+                          'out_of_distribution': bool(ood_flags[0])}
+        else:
+            ood_report = {'scores': ood_scores.tolist(), 'threshold': bundle.ood_detector.threshold,
+                          'out_of_distribution': ood_flags.tolist()}
+        if OOD_MODE == 'reject' and ood_flags.any():
+            return make_error_response(
+                'These features differ too much from the training data for a reliable result.',
+                'OUT_OF_DISTRIBUTION', 422, {'ood': ood_report})
+
+    tier = choose_tier(bundle)
+    with time_stage('predict'):
+        probabilities = bundle.predict_proba(features_scaled, tier)
+    predictions = probabilities.argmax(axis=1)
+    confidences = probabilities[np.arange(len(predictions)), predictions] * 100
+    if tier == 'full':
+        registry.score_shadow(features_array, probabilities, bundle.version)
+
+    if single:
         return jsonify({
-            'prediction': int(prediction),      # Cast to standard Python int
-            'confidence': float(confidence),    # Cast to standard Python float
-            'quality_report': {
-                'warnings': quality_report['warnings'],
-                'quality_score': float(quality_report['quality_score']),
-                'snr': float(quality_report['snr']),
-                'amplitude': float(quality_report['amplitude'])
-            }
+            'prediction': int(predictions[0]),
+            'confidence': float(confidences[0]),
+            'probability': float(probabilities[0, 1]),
+            'ood': ood_report,
+            'model_version': bundle.version,
+            'model_tier': tier
         })
+    return jsonify({
+        'predictions': predictions.tolist(),
+        'confidences': confidences.tolist(),
+        'probabilities': probabilities[:, 1].tolist(),
+        'ood': ood_report,
+        'model_version': bundle.version,
+        'model_tier': tier
+    })
+
+# --- Raw PCM extraction service for the Next.js server ---
+PCM_FORMATS = {'s16le': ('<i2', 32768.0), 'f32le': ('<f4', 1.0)}
+
+@app.route('/extract', methods=['POST'])
+def extract():
+    """
+    Raw PCM in (application/octet-stream), features and prediction out; used
+    by the Next.js /api/analyze-audio route so DSP never runs on its event loop.
+    Headers: X-Sample-Rate (22050), X-Channels (1), X-Sample-Format (s16le or f32le),
+    and optionally X-User-Id and X-Language, stored with the result like /process_and_predict's.
+    Runs in the analysis lane (EXTRACTION_WORKERS at once by default); time
+    spent waiting for a slot is reported as queue_ms and in the Server-Timing header.
+    """
+    bundle = registry.active
+    if bundle is None:
+        return make_error_response('Model not loaded. Please contact support.', 'MODEL_NOT_FOUND', 500)
+    received = g.request_start
+    try:
+        sr = int(request.headers.get('X-Sample-Rate', 22050))
+        channels = int(request.headers.get('X-Channels', 1))
+        dtype, full_scale = PCM_FORMATS[request.headers.get('X-Sample-Format', 's16le')]
+        if sr <= 0 or channels <= 0:
+            raise ValueError
+    except (ValueError, KeyError):
+        return make_error_response('Invalid PCM format headers.', 'INVALID_AUDIO_FORMAT', 400)
+
+    body = request.get_data(cache=False)
+    frame_bytes = np.dtype(dtype).itemsize * channels
+    if not body or len(body) % frame_bytes:
+        return make_error_response('Body must contain whole PCM frames.', 'INVALID_AUDIO_FORMAT', 400)
+    pcm = np.frombuffer(body, dtype=dtype)[:int(MAX_AUDIO_SECONDS * sr) * channels]
+    y = pcm.reshape(-1, channels).mean(axis=1, dtype=np.float32) if channels > 1 else pcm.astype(np.float32)
+    if full_scale != 1.0:
+        y /= full_scale
+    del body, pcm
+
+    queue_seconds = g.get('queue_seconds', 0.0)
+    extraction_start = time.perf_counter()
+    memory = RssTracker()
+    timer = deadline_timer(make_stage_timer(memory=memory), g.get('deadline'))
+    try:
+        if sr != 22050:
+            with timer('resample'):
+                y = librosa.resample(y, orig_sr=sr, target_sr=22050)
+            sr = 22050
+        input_seconds = len(y) / sr
+        with timer('quality_check'):
+            quality_report = analyze_audio_quality(y, sr)
+        if quality_report['warnings']:
+            return make_error_response('. '.join(quality_report['warnings']), 'POOR_AUDIO_QUALITY', 400)
+        display_features = {}
+        plan = preprocessing_planner.plan(quality_report)
+        features, durations = run_feature_pipeline(y, sr, timer, extras=display_features, plan=plan)
+    except ProcessingError as e:
+        return make_error_response(e.message, e.code, e.status_code, e.details)
+    extraction_seconds = time.perf_counter() - extraction_start
+
+    # Same steps as /process_and_predict: OOD check before the model runs,
+    # explanation row, shadow scoring, and the result stored for history/export
+    predict_start = time.perf_counter()
+    features_array = np.array(features, dtype=np.float64).reshape(1, -1)
+    with time_stage('scale'):
+        features_scaled = bundle.scale(features_array)
+    ood_report = None
+    if bundle.ood_detector:
+        ood_scores, ood_flags = bundle.ood_detector.check(features_scaled)
+        ood_report = {'score': float(ood_scores[0]), 'threshold': bundle.ood_detector.threshold,
+                      'out_of_distribution': bool(ood_flags[0])}
+        if OOD_MODE == 'reject' and ood_flags[0]:
+            return make_error_response(
+                'This recording differs too much from the training data for a reliable result. Please record again.',
+                'OUT_OF_DISTRIBUTION', 422, {'ood': ood_report})
+    tier = choose_tier(bundle)
+    with time_stage('predict'):
+        probability = bundle.predict_proba(features_scaled, tier)[0]
+    explanation_service = bundle.explanation_service
+    result_id = explanation_service.register(features_scaled)[0] if explanation_service else None
+    if tier == 'full':
+        registry.score_shadow(features_array, probability.reshape(1, -1), bundle.version, [result_id])
+    predict_seconds = time.perf_counter() - predict_start
+
+    result = prediction_result(bundle, probability, tier, result_id, ood_report,
+                               input_seconds, durations, memory, quality_report, plan)
+    results_store.add({**result, 'user_id': request.headers.get('X-User-Id'),
+                       'language': request.headers.get('X-Language', 'en')})
+
+    timings = {
+        'queue_ms': round(queue_seconds * 1000, 2),
+        'extraction_ms': round(extraction_seconds * 1000, 2),
+        'predict_ms': round(predict_seconds * 1000, 2),
+        'server_ms': round((time.perf_counter() - received) * 1000, 2)
+    }
+    response = jsonify({
+        **result,
+        'features': dict(zip(bundle.feature_names, map(float, features))),
+        'display_features': display_features,
+        'audio_seconds': {k: round(v, 2) for k, v in durations.items()},
+        'timings': timings
+    })
+    response.headers['Server-Timing'] = ', '.join(
+        f"{name};dur={timings[name + '_ms']}" for name in ('queue', 'extraction', 'predict'))
+    return response
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/explain', methods=['POST'])
+def explain():
+    """
+    Returns SHAP values for a previous prediction ('result_id' or 'result_ids')
+    or for raw feature vectors ('features': one vector or a list of vectors).
+    """
+    bundle = registry.active
+    explanation_service = bundle.explanation_service if bundle else None
+    if not explanation_service:
+        return make_error_response('Explanations are not available.', 'EXPLAINER_UNAVAILABLE', 500)
+
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'result_id' in data or 'result_ids' in data:
+            result_ids = data.get('result_ids') or [data['result_id']]
+            explanation = explanation_service.explain_ids(result_ids)
+        elif 'features' in data:
+            features_array = np.atleast_2d(np.asarray(data['features'], dtype=np.float64))
+            explanation = explanation_service.explain(bundle.scale(features_array))
+        else:
+            return make_error_response('Provide a result_id or features to explain.', 'NO_FEATURES', 400)
+    except ExplainerUnavailable as e:
+        print(f"⚠️ {e}")
+        return make_error_response('Explanations are not available.', 'EXPLAINER_UNAVAILABLE', 500)
+    except KeyError:
+        return make_error_response('Unknown or expired result_id.', 'RESULT_NOT_FOUND', 404)
+    except ValueError as e:
+        return make_error_response(f'Invalid features: {e}', 'INVALID_FEATURES', 400)
+
+    return jsonify({
+        'result_ids': explanation['result_ids'],
+        'feature_names': bundle.feature_names,
+        'base_value': float(explanation['base_value']),
+        'shap_values': explanation['values'].tolist()
+    })
+
+def has_admin_token():
+    """True when MODEL_ADMIN_TOKEN is set and the request's X-Admin-Token matches it."""
+    return bool(MODEL_ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), MODEL_ADMIN_TOKEN)
+
+def check_admin_token():
+    """
+    Admin endpoints require X-Admin-Token to match MODEL_ADMIN_TOKEN, and are
+    disabled (403) when it is unset: with CORS open, any page a user visits
+    could otherwise call them.
+    """
+    if not MODEL_ADMIN_TOKEN:
+        return make_error_response('Admin endpoints are disabled; set MODEL_ADMIN_TOKEN to enable them.',
+                                   'ADMIN_DISABLED', 403)
+    if not has_admin_token():
+        return make_error_response('Invalid admin token.', 'UNAUTHORIZED', 401)
+    return None
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Available model versions, the active and shadow versions, shadow agreement counts and tier load."""
+    return jsonify({**registry.status(), 'tiers': tier_selector.status()})
+
+@app.route('/models/activate', methods=['POST'])
+def activate_model():
+    """Hot-swaps the served model: {"version": "v20240101-120000"}. In-flight requests finish on the old one."""
+    error = check_admin_token()
+    if error:
+        return error
+    version = (request.get_json(silent=True) or {}).get('version')
+    try:
+        registry.activate(version)
+    except KeyError:
+        return make_error_response(f'Unknown model version: {version}', 'MODEL_VERSION_NOT_FOUND', 404)
     except Exception as e:
-        print(f"Prediction error: {e}")
-        return make_error_response('An unexpected error occurred during prediction.', 'PREDICTION_FAILED', 500)
+        return make_error_response(f'Could not load model {version}: {e}', 'MODEL_LOAD_FAILED', 500)
+    return jsonify(registry.status())
+
+@app.route('/models/shadow', methods=['POST'])
+def shadow_model():
+    """Scores live traffic with a candidate in the background: {"version": ...}, or {"version": null} to stop."""
+    error = check_admin_token()
+    if error:
+        return error
+    version = (request.get_json(silent=True) or {}).get('version')
+    try:
+        registry.set_shadow(version)
+    except KeyError:
+        return make_error_response(f'Unknown model version: {version}', 'MODEL_VERSION_NOT_FOUND', 404)
+    except Exception as e:
+        return make_error_response(f'Could not load model {version}: {e}', 'MODEL_LOAD_FAILED', 500)
+    return jsonify(registry.status())
+
+def get_result_filters(source):
+    """
+    Extracts results store filters from query args or a JSON body. Raises
+    ValueError for a bad value here, before any response is started.
+    """
+    filters = {key: source.get(key) for key in ('user_id', 'prediction', 'since', 'until') if source.get(key) is not None}
+    if 'prediction' in filters:
+        filters['prediction'] = int(filters['prediction'])
+    for key in ('since', 'until'):
+        if key in filters:
+            # Stored timestamps are local 'YYYY-MM-DD HH:MM:SS' strings compared as text
+            moment = datetime.fromisoformat(str(filters[key]))
+            if moment.tzinfo is not None:
+                moment = moment.astimezone().replace(tzinfo=None)
+            filters[key] = moment.strftime('%Y-%m-%d %H:%M:%S')
+    return filters
+
+@app.route('/results', methods=['GET'])
+def list_results():
+    """Paginated stored results, newest first. Pass next_before_id as before_id for the next page."""
+    error = check_admin_token()
+    if error:
+        return error
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        results = results_store.query(limit=limit, before_id=request.args.get('before_id'),
+                                      **get_result_filters(request.args))
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    return jsonify({
+        'results': results,
+        'next_before_id': results[-1]['id'] if len(results) == limit else None
+    })
+
+@app.route('/results/summary', methods=['GET'])
+def results_summary():
+    error = check_admin_token()
+    if error:
+        return error
+    try:
+        return jsonify({'summary': results_store.summary(**get_result_filters(request.args))})
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
 
 @app.route('/export', methods=['POST'])
 def export_report():
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         export_format = data.get('format', 'pdf')
-        history = data.get('history', [])
+        history = data.get('history')
+
+        # Without a client-supplied history, export straight from the results
+        # store; it holds every user's results, so this needs the admin token
+        if not history:
+            error = check_admin_token()
+            if error:
+                return error
+            try:
+                filters = get_result_filters(data)
+            except ValueError:
+                return jsonify({'error': 'Invalid filters'}), 400
+            if export_format == 'pdf':
+                history = results_store.query(limit=1, **filters)
+            elif export_format in ('csv', 'parquet'):
+                rows = results_store.iter_results(**filters)
+                first = next(rows, None)  # a generator is always truthy
+                history = itertools.chain([first], rows) if first is not None else []
+            else:
+                history = list(results_store.iter_results(**filters))
+            if not history:
+                return make_error_response('No stored results match the filters.', 'NO_RESULTS', 404)
 
         if not history:
             return jsonify({'error': 'No data provided for export'}), 400
@@ -129,9 +1076,21 @@ def export_report():
         if export_format == 'pdf':
             buffer = generate_pdf_report(history[0]) # PDF for the most recent result
             return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name='parkinsons_report.pdf')
+        elif export_format == 'clinic_pdf':
+            buffer = generate_clinic_report(history) # One multi-page PDF for all history
+            return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name='parkinsons_clinic_report.pdf')
+        elif export_format == 'pdf_batch':
+            buffer = generate_pdf_archive(history, PDF_PROCESSES) # One PDF per result, rendered in parallel
+            return send_file(buffer, mimetype='application/zip', as_attachment=True, download_name='parkinsons_reports.zip')
         elif export_format == 'csv':
-            buffer = generate_csv_report(history) # CSV for all history
-            return send_file(buffer, mimetype='text/csv', as_attachment=True, download_name='parkinsons_history.csv')
+            # CSV for all history, streamed as a chunked response
+            return Response(stream_with_context(iter_csv_report(history)), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=parkinsons_history.csv'})
+        elif export_format == 'parquet':
+            if not PARQUET_AVAILABLE:
+                return jsonify({'error': 'Parquet export is not available on this server'}), 400
+            return Response(stream_with_context(iter_parquet_report(history)), mimetype='application/vnd.apache.parquet',
+                            headers={'Content-Disposition': 'attachment; filename=parkinsons_history.parquet'})
         else:
             return jsonify({'error': 'Invalid export format specified'}), 400
     except Exception as e:
@@ -139,4 +1098,28 @@ def export_report():
         return jsonify({'error': 'An error occurred during report generation.'}), 500
 
 if __name__ == '__main__':
-    app.run(port=5001, debug=True)
\ No newline at end of file
+    port = int(os.environ.get('PORT', 5001))
+    debug = os.environ.get('FLASK_DEBUG', '1') == '1'
+    try:
+        # The Flask development server closes every connection; waitress keeps
+        # HTTP/1.1 connections alive so the Next.js server can pool them.
+        from waitress import serve
+    except ImportError:
+        serve = None
+    unix_socket = os.environ.get('UNIX_SOCKET')  # e.g. /tmp/parkinsons.sock for the Next.js server
+    if serve and not debug:
+        # Queued requests and event streams hold their thread, so size the pool for all of them
+        threads = int(os.environ.get('SERVER_THREADS',
+                                     scheduler.thread_demand() + MAX_EVENT_STREAMS + UNSCHEDULED_THREADS))
+        if threads < scheduler.thread_demand() + 1:
+            print(f"⚠️ SERVER_THREADS={threads} is below the {scheduler.thread_demand()} requests the lanes can hold; "
+                  f"a burst of queued work can delay mic checks before the scheduler sees them.")
+        print(f"Request lanes: {LANE_CONCURRENCY} running, {LANE_QUEUE_LIMIT} queued; {threads} server threads")
+        if unix_socket:
+            print(f"Serving with waitress on {unix_socket}")
+            serve(app, unix_socket=unix_socket, unix_socket_perms='600', threads=threads)
+        else:
+            print(f"Serving with waitress on port {port}")
+            serve(app, host='127.0.0.1', port=port, threads=threads)
+    else:
+        app.run(port=port, debug=debug)
\ No newline at end of file
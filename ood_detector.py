@@ -0,0 +1,50 @@
+import os
+import joblib
+import numpy as np
+from scipy.stats import chi2
+
+class OODDetector:
+    """
+    Flags feature vectors far from the training distribution using the
+    Mahalanobis distance in scaled feature space.
+    """
+
+    def __init__(self, mean, inv_cov, threshold):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.inv_cov = np.ascontiguousarray(inv_cov, dtype=np.float64)
+        self.threshold = float(threshold)
+
+    @classmethod
+    def load(cls, directory='.'):
+        """
+        Loads ood_stats.pkl written by the trainer. Older artifacts only have
+        training_stats.pkl or training_data_mean.pkl, so fall back to a diagonal
+        or identity covariance. Returns None when no statistics exist.
+        """
+        ood_path = os.path.join(directory, 'ood_stats.pkl')
+        stats_path = os.path.join(directory, 'training_stats.pkl')
+        mean_path = os.path.join(directory, 'training_data_mean.pkl')
+
+        if os.path.exists(ood_path):
+            stats = joblib.load(ood_path)
+            return cls(stats['mean'], stats['inv_cov'], stats['threshold'])
+
+        if os.path.exists(stats_path):
+            stats = joblib.load(stats_path)
+            mean, inv_cov = stats['mean'], np.diag(1.0 / (np.asarray(stats['std']) ** 2 + 1e-6))
+        elif os.path.exists(mean_path):
+            mean = joblib.load(mean_path)
+            inv_cov = np.eye(len(mean))  # scaled features have unit variance
+        else:
+            return None
+        return cls(mean, inv_cov, np.sqrt(chi2.ppf(0.99, df=len(mean))))
+
+    def score(self, X_scaled):
+        """Mahalanobis distance of each scaled row, vectorized over the batch."""
+        diff = np.atleast_2d(X_scaled) - self.mean
+        return np.sqrt(np.einsum('ij,jk,ik->i', diff, self.inv_cov, diff))
+
+    def check(self, X_scaled):
+        """Returns (scores, out_of_distribution flags) for a batch of rows."""
+        scores = self.score(X_scaled)
+        return scores, scores > self.threshold
@@ -0,0 +1,160 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+# tracemalloc is process-wide, so only one request is profiled at a time
+_active_lock = threading.Lock()
+
+def read_rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+class RssTracker:
+    """Tracks the highest RSS seen at pipeline stage boundaries during one request."""
+
+    def __init__(self):
+        self.start = self.peak = read_rss_bytes()
+
+    def sample(self):
+        self.peak = max(self.peak, read_rss_bytes())
+
+    @property
+    def peak_mb(self):
+        return round(self.peak / 1e6, 1)
+
+class RequestProfiler:
+    """
+    Per-request profiler: wall time, CPU time and peak Python allocation per
+    pipeline stage (tracemalloc), plus a sampling profiler of the request
+    thread whose stacks are written in the folded format read by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, name, interval=0.005):
+        self.name = name
+        self.interval = interval
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.stages = []
+        self.samples = {}
+        self._current_stage = 'other'
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+        self._started_tracemalloc = False
+        self._open_stages = []
+        self._request_peak = 0
+
+    @classmethod
+    def start(cls, name, interval=0.005):
+        """Starts profiling the calling thread, or returns None if another request is being profiled."""
+        if not _active_lock.acquire(blocking=False):
+            return None
+        profiler = cls(name, interval)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            profiler._started_tracemalloc = True
+        profiler._start_wall = time.perf_counter()
+        profiler._start_cpu = time.thread_time()
+        profiler._sampler.start()
+        return profiler
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(f"stage:{self._current_stage}")
+            key = ';'.join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+    def _fold_peak(self):
+        """
+        Folds tracemalloc's peak since the last reset into every open stage
+        and the request, then resets it. Nested stages reset the global peak,
+        so each stage keeps its own maximum instead of reading it at exit.
+        """
+        _, peak = tracemalloc.get_traced_memory()
+        self._request_peak = max(self._request_peak, peak)
+        for open_stage in self._open_stages:
+            open_stage['peak'] = max(open_stage['peak'], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name):
+        """Records wall/CPU time and peak allocation of one pipeline stage."""
+        previous_stage = self._current_stage
+        self._current_stage = name
+        self._fold_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+        self._open_stages.append({'peak': start_memory})
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self._fold_peak()
+            peak_memory = self._open_stages.pop()['peak']
+            self.stages.append({
+                'stage': name,
+                'wall_ms': round((time.perf_counter() - start_wall) * 1000, 3),
+                'cpu_ms': round((time.thread_time() - start_cpu) * 1000, 3),
+                'peak_alloc_kb': round(max(peak_memory - start_memory, 0) / 1024, 1)
+            })
+            self._current_stage = previous_stage
+
+    def stop(self, directory='profiles', keep=None):
+        """
+        Stops profiling and writes <id>.json (stage table) and <id>.folded
+        (stacks), keeping only the newest `keep` profiles. Returns the id.
+        """
+        try:
+            self._stop.set()
+            self._sampler.join()
+            self._fold_peak()
+            peak_memory = self._request_peak
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+            os.makedirs(directory, exist_ok=True)
+            base_path = os.path.join(directory, self.profile_id)
+            with open(base_path + '.json', 'w') as f:
+                json.dump({
+                    'name': self.name,
+                    'wall_ms': round((time.perf_counter() - self._start_wall) * 1000, 3),
+                    'cpu_ms': round((time.thread_time() - self._start_cpu) * 1000, 3),
+                    'peak_alloc_kb': round(peak_memory / 1024, 1),
+                    'sample_interval_ms': self.interval * 1000,
+                    'stages': self.stages
+                }, f, indent=2)
+            with open(base_path + '.folded', 'w') as f:
+                for stack, count in sorted(self.samples.items()):
+                    f.write(f"{stack} {count}\n")
+            if keep:
+                prune_profiles(directory, keep)
+            return self.profile_id
+        finally:
+            _active_lock.release()
+
+def prune_profiles(directory, keep):
+    """Deletes all but the newest `keep` profiles (.json and .folded pairs) in `directory`."""
+    profiles = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+                      key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in profiles[keep:]:
+        for path in (entry.path, entry.path[:-len('.json')] + '.folded'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -1,77 +1,283 @@
 from fpdf import FPDF
 import io
 import csv
+import copy
+import multiprocessing
+import sys
+import threading
+import types
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
-def generate_pdf_report(data):
-    """Generates a PDF report from analysis data."""
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Helvetica", "B", 16)
-
-    # Header
-    pdf.cell(0, 10, "Parkinson's Voice Analysis Report", 0, 1, 'C')
-    pdf.set_font("Helvetica", "", 10)
-    pdf.cell(0, 10, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 0, 1, 'C')
-    pdf.ln(10)
-
-    # Summary
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 10, "Analysis Summary", 0, 1)
-    pdf.set_font("Helvetica", "", 11)
-    prediction_text = "At Risk" if data.get('prediction') == 1 else "Likely Healthy"
-    pdf.cell(0, 8, f"Prediction: {prediction_text}", 0, 1)
-    pdf.cell(0, 8, f"Confidence: {data.get('confidence', 0):.1f}%", 0, 1)
-    pdf.ln(5)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+PARQUET_AVAILABLE = pa is not None
+
+CSV_HEADER = [
+    'timestamp', 'prediction', 'confidence', 
+    'quality_score', 'snr', 'amplitude'
+]
+
+DISCLAIMER = "Disclaimer: This tool is for educational and informational purposes only and should not be used as a substitute for professional medical advice, diagnosis, or treatment. Always seek the advice of your physician or other qualified health provider with any questions you may have regarding a medical condition."
+
+class ReportRenderer:
+    """
+    Renders analysis reports from a page template that is laid out once
+    (fonts, title, disclaimer) and copied per report, so only the
+    per-result fields are drawn on each call.
+    """
 
-    # Quality Report
-    if 'quality_report' in data:
+    def __init__(self):
+        self._template = FPDF()
+        self._template.set_auto_page_break(True, margin=40)
+        self._template.add_page()
+        self._draw_static(self._template)
+
+    def _draw_static(self, pdf):
+        """Draws the title and the disclaimer pinned to the bottom of the current page."""
+        pdf.set_font("Helvetica", "B", 16)
+        pdf.cell(0, 10, "Parkinson's Voice Analysis Report", 0, 1, 'C')
+        content_y = pdf.get_y()
+
+        pdf.set_auto_page_break(False)
+        pdf.set_y(-35)
+        pdf.set_font("Helvetica", "I", 9)
+        pdf.multi_cell(0, 5, DISCLAIMER)
+        pdf.set_auto_page_break(True, margin=40)
+        pdf.set_y(content_y)
+
+    def _draw_result(self, pdf, data, date_text):
+        # Header
+        pdf.set_font("Helvetica", "", 10)
+        pdf.cell(0, 10, f"Date: {date_text}", 0, 1, 'C')
+        pdf.ln(10)
+
+        # Summary
         pdf.set_font("Helvetica", "B", 12)
-        pdf.cell(0, 10, "Audio Quality", 0, 1)
+        pdf.cell(0, 10, "Analysis Summary", 0, 1)
         pdf.set_font("Helvetica", "", 11)
-        qr = data['quality_report']
-        pdf.cell(0, 8, f"Overall Quality Score: {qr.get('quality_score', 'N/A')}/100", 0, 1)
-        pdf.cell(0, 8, f"Signal-to-Noise Ratio (SNR): {qr.get('snr', 'N/A')} dB", 0, 1)
+        prediction_text = "At Risk" if data.get('prediction') == 1 else "Likely Healthy"
+        pdf.cell(0, 8, f"Prediction: {prediction_text}", 0, 1)
+        pdf.cell(0, 8, f"Confidence: {data.get('confidence', 0):.1f}%", 0, 1)
         pdf.ln(5)
 
-    # Disclaimer
-    pdf.set_font("Helvetica", "I", 9)
-    pdf.multi_cell(0, 5, "Disclaimer: This tool is for educational and informational purposes only and should not be used as a substitute for professional medical advice, diagnosis, or treatment. Always seek the advice of your physician or other qualified health provider with any questions you may have regarding a medical condition.")
+        # Quality Report
+        if 'quality_report' in data:
+            pdf.set_font("Helvetica", "B", 12)
+            pdf.cell(0, 10, "Audio Quality", 0, 1)
+            pdf.set_font("Helvetica", "", 11)
+            qr = data['quality_report']
+            pdf.cell(0, 8, f"Overall Quality Score: {qr.get('quality_score', 'N/A')}/100", 0, 1)
+            pdf.cell(0, 8, f"Signal-to-Noise Ratio (SNR): {qr.get('snr', 'N/A')} dB", 0, 1)
+            pdf.ln(5)
 
-    # Create an in-memory bytes buffer
-    pdf_buffer = io.BytesIO()
-    pdf.output(pdf_buffer)
-    pdf_buffer.seek(0)
-    return pdf_buffer
+    def render(self, data):
+        """Renders a single-result report and returns the PDF bytes."""
+        pdf = copy.deepcopy(self._template)
+        self._draw_result(pdf, data, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        return bytes(pdf.output())
 
-def generate_csv_report(data_list):
-    """Generates a CSV report from a list of analysis data."""
+    def render_clinic_report(self, data_list):
+        """Renders one multi-page report with a page per result."""
+        pdf = FPDF()
+        pdf.set_auto_page_break(True, margin=40)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for i, data in enumerate(data_list, 1):
+            pdf.add_page()
+            self._draw_static(pdf)
+            self._draw_result(pdf, data, data.get('timestamp', now))
+            pdf.set_font("Helvetica", "", 9)
+            pdf.cell(0, 8, f"Result {i} of {len(data_list)}", 0, 1, 'R')
+        return bytes(pdf.output())
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+def get_renderer():
+    """Returns the process-wide ReportRenderer, creating it on first use."""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ReportRenderer()
+    return _renderer
+
+def _render_in_worker(data):
+    return get_renderer().render(data)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_render_pool(processes):
+    """
+    Returns the process-wide PDF worker pool, starting `processes` workers on
+    first use. Workers come from a forkserver
+    fork()ed from the threaded server, and are started with a bare __main__:
+    they only need this module, not the server script that imported it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            pool = ProcessPoolExecutor(max_workers=processes, mp_context=context)
+            main = sys.modules['__main__']
+            sys.modules['__main__'] = types.ModuleType('__main__')
+            try:
+                # One task per worker starts them all now, each building its template
+                warmups = [pool.submit(get_renderer) for _ in range(processes)]
+            finally:
+                sys.modules['__main__'] = main
+            for warmup in warmups:
+                warmup.exception()
+            _pool = pool
+        return _pool
+
+def render_pdf_reports(data_list, processes=1, min_parallel=32):
+    """
+    Renders one PDF per result. Large batches are split across the shared
+    worker pool when `processes` > 1; small ones stay in-process.
+    """
+    if processes <= 1 or len(data_list) < min_parallel:
+        renderer = get_renderer()
+        return [renderer.render(data) for data in data_list]
+
+    global _pool
+    pool = get_render_pool(processes)
+    try:
+        return list(pool.map(_render_in_worker, data_list, chunksize=16))
+    except BrokenProcessPool:  # a worker died; start a fresh pool next time
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+def generate_pdf_report(data):
+    """Generates a PDF report from analysis data."""
+    return io.BytesIO(get_renderer().render(data))
+
+def generate_clinic_report(data_list):
+    """Generates a multi-page PDF report covering a whole history."""
+    return io.BytesIO(get_renderer().render_clinic_report(data_list))
+
+def generate_pdf_archive(data_list, processes=1):
+    """Generates a ZIP archive with one PDF report per result."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+        for i, pdf_bytes in enumerate(render_pdf_reports(data_list, processes), 1):
+            zf.writestr(f"parkinsons_report_{i:05d}.pdf", pdf_bytes)
+    archive.seek(0)
+    return archive
+
+def _csv_row(data):
+    prediction_text = "At Risk" if data.get('prediction') == 1 else "Likely Healthy"
+    qr = data.get('quality_report', {})
+    return [
+        data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+        prediction_text,
+        f"{data.get('confidence', 0):.1f}",
+        qr.get('quality_score', 'N/A'),
+        qr.get('snr', 'N/A'),
+        qr.get('amplitude', 'N/A')
+    ]
+
+def iter_csv_report(data_iter, rows_per_chunk=500):
+    """
+    Yields a CSV report as UTF-8 encoded chunks of rows_per_chunk rows, so
+    any number of results can be streamed in constant memory.
+    """
     output = io.StringIO()
     writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
 
-    # Header
-    header = [
-        'timestamp', 'prediction', 'confidence', 
-        'quality_score', 'snr', 'amplitude'
-    ]
-    writer.writerow(header)
+    for i, data in enumerate(data_iter, 1):
+        writer.writerow(_csv_row(data))
+        if i % rows_per_chunk == 0:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate(0)
 
-    # Rows
-    for data in data_list:
-        prediction_text = "At Risk" if data.get('prediction') == 1 else "Likely Healthy"
-        qr = data.get('quality_report', {})
-        row = [
-            data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
-            prediction_text,
-            f"{data.get('confidence', 0):.1f}",
-            qr.get('quality_score', 'N/A'),
-            qr.get('snr', 'N/A'),
-            qr.get('amplitude', 'N/A')
-        ]
-        writer.writerow(row)
-
-    # Create an in-memory bytes buffer
+    if output.tell():
+        yield output.getvalue().encode('utf-8')
+
+def generate_csv_report(data_list):
+    """Generates a CSV report from a list of analysis data."""
     csv_buffer = io.BytesIO()
-    csv_buffer.write(output.getvalue().encode('utf-8'))
+    for chunk in iter_csv_report(data_list):
+        csv_buffer.write(chunk)
     csv_buffer.seek(0)
-    return csv_buffer
\ No newline at end of file
+    return csv_buffer
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that collects bytes for a generator to drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_parquet_report(data_iter, rows_per_group=5000):
+    """
+    Yields a Parquet file (one row group per rows_per_group results) as byte
+    chunks. Columns are typed, so the file is far smaller than the CSV.
+    Requires pyarrow.
+    """
+    if pa is None:
+        raise RuntimeError('Parquet export requires pyarrow.')
+
+    schema = pa.schema([
+        ('timestamp', pa.string()),
+        ('prediction', pa.int8()),
+        ('confidence', pa.float32()),
+        ('quality_score', pa.float32()),
+        ('snr', pa.float32()),
+        ('amplitude', pa.float32())
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def write_group(rows):
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(schema.names)}
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+    rows = []
+    for data in data_iter:
+        qr = data.get('quality_report', {})
+        rows.append((
+            data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+            data.get('prediction'),
+            data.get('confidence'),
+            qr.get('quality_score'),
+            qr.get('snr'),
+            qr.get('amplitude')
+        ))
+        if len(rows) == rows_per_group:
+            write_group(rows)
+            rows = []
+            yield sink.drain()
+
+    if rows:
+        write_group(rows)
+    writer.close()
+    yield sink.drain()
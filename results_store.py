@@ -0,0 +1,170 @@
+import queue
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    result_id TEXT,
+    timestamp TEXT NOT NULL,
+    user_id TEXT,
+    language TEXT,
+    prediction INTEGER NOT NULL,
+    confidence REAL,
+    quality_score REAL,
+    snr REAL,
+    amplitude REAL,
+    ood_score REAL
+);
+CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_user ON results (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_prediction ON results (prediction, timestamp);
+"""
+
+COLUMNS = ['result_id', 'timestamp', 'user_id', 'language', 'prediction',
+           'confidence', 'quality_score', 'snr', 'amplitude', 'ood_score']
+
+class ResultsStore:
+    """
+    Embedded SQLite (WAL mode) store of analysis results. Writes are queued
+    and committed in batches by a background thread, off the request path.
+    """
+
+    def __init__(self, path='results.db', max_batch=500, flush_interval=0.5):
+        self.path = path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+        self._writer = threading.Thread(target=self._writer_loop, name='results-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _reader(self):
+        """One read connection per thread; sqlite3 connections are not thread-safe."""
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = self._connect()
+        return self._local.conn
+
+    def add(self, result):
+        """Queues a /process_and_predict result (response dict plus metadata) for storage."""
+        qr = result.get('quality_report') or {}
+        ood = result.get('ood') or {}
+        self._queue.put((
+            result.get('result_id'),
+            result['timestamp'],
+            result.get('user_id'),
+            result.get('language'),
+            int(result['prediction']),
+            result.get('confidence'),
+            qr.get('quality_score'),
+            qr.get('snr'),
+            qr.get('amplitude'),
+            ood.get('score')
+        ))
+
+    def _writer_loop(self):
+        conn = self._connect()
+        insert = f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        while True:
+            rows = [self._queue.get()]
+            try:
+                while len(rows) < self.max_batch:
+                    rows.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            try:
+                conn.executemany(insert, rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Results store write error: {e}")
+            for _ in rows:
+                self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued result has been written."""
+        self._queue.join()
+
+    def pending(self):
+        """Number of results waiting to be written."""
+        return self._queue.qsize()
+
+    def _where(self, user_id=None, prediction=None, since=None, until=None, before_id=None):
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append('user_id = ?')
+            params.append(user_id)
+        if prediction is not None:
+            clauses.append('prediction = ?')
+            params.append(int(prediction))
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        if before_id is not None:
+            clauses.append('id < ?')
+            params.append(int(before_id))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    @staticmethod
+    def _to_result(row):
+        """Converts a row to the result shape used by the client history and exports."""
+        return {
+            'id': row['id'],
+            'result_id': row['result_id'],
+            'timestamp': row['timestamp'],
+            'user_id': row['user_id'],
+            'language': row['language'],
+            'prediction': row['prediction'],
+            'confidence': row['confidence'],
+            'quality_report': {
+                'quality_score': row['quality_score'],
+                'snr': row['snr'],
+                'amplitude': row['amplitude']
+            },
+            'ood_score': row['ood_score']
+        }
+
+    def query(self, limit=100, **filters):
+        """
+        Returns up to `limit` results, newest first. Pass the last returned
+        'id' as before_id to fetch the next page (keyset pagination).
+        """
+        where, params = self._where(**filters)
+        rows = self._reader().execute(
+            f"SELECT * FROM results{where} ORDER BY id DESC LIMIT ?", params + [int(limit)]
+        ).fetchall()
+        return [self._to_result(row) for row in rows]
+
+    def iter_results(self, page_size=1000, **filters):
+        """Yields all matching results page by page, in constant memory."""
+        filters.pop('before_id', None)
+        before_id = None
+        while True:
+            page = self.query(limit=page_size, before_id=before_id, **filters)
+            yield from page
+            if len(page) < page_size:
+                return
+            before_id = page[-1]['id']
+
+    def summary(self, **filters):
+        """Counts and mean confidence per prediction class, for dashboards."""
+        where, params = self._where(**filters)
+        rows = self._reader().execute(
+            f"SELECT prediction, COUNT(*) AS count, AVG(confidence) AS mean_confidence "
+            f"FROM results{where} GROUP BY prediction", params
+        ).fetchall()
+        return {str(row['prediction']): {'count': row['count'], 'mean_confidence': row['mean_confidence']} for row in rows}
@@ -0,0 +1,138 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+class RequestShed(Exception):
+    """A request turned away instead of run: its lane's queue is full, its deadline passed, or its client is at its limit."""
+
+    def __init__(self, message, code, status_code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status_code = status_code
+
+class Scheduler:
+    """
+    Admits requests into priority lanes. Each lane runs at most its
+    `concurrency` requests at once, first come first served, and a lane
+    starts nothing while a higher-priority lane (lower number) has requests
+    waiting, so cheap interactive work never queues behind heavy work.
+    Requests are shed when their lane already has `max_queued` waiting,
+    when their deadline passes while they wait, or when their client is
+    already running `per_client_limit`.
+
+    Waiting requests hold their server thread, so the server needs
+    `thread_demand()` threads for a request to always reach the scheduler.
+    `gauge` (optional) is set to each lane's waiting and running counts as
+    they change.
+    """
+
+    def __init__(self, lanes, per_client_limit=0, gauge=None):
+        self.lanes = lanes  # name -> {'priority': int, 'concurrency': int, 'max_queued': int}
+        self.per_client_limit = per_client_limit
+        self.gauge = gauge
+        self.running = {name: 0 for name in lanes}
+        self.shed = {name: 0 for name in lanes}
+        self._queues = {name: deque() for name in lanes}
+        self._bounded_waiting = {name: 0 for name in lanes}
+        self._clients = {}
+        self._tickets = itertools.count()
+        self._changed = threading.Condition()
+        for name in lanes:
+            self._publish(name)
+
+    @staticmethod
+    def parse_lane_values(spec, defaults, minimum=1):
+        """'interactive=4,export=1' over `defaults` -> {'interactive': 4, 'analysis': ..., 'export': 1}"""
+        values = dict(defaults)
+        for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+            lane, _, value = item.partition('=')
+            values[lane.strip()] = max(minimum, int(value))
+        return values
+
+    def thread_demand(self):
+        """Requests that can be running or queued in all lanes at once."""
+        return sum(config['concurrency'] + config['max_queued'] for config in self.lanes.values())
+
+    def _lane_free(self, lane):
+        """A slot is open and no higher-priority lane has requests waiting."""
+        if self.running[lane] >= self.lanes[lane]['concurrency']:
+            return False
+        priority = self.lanes[lane]['priority']
+        return not any(self._queues[other] for other, config in self.lanes.items() if config['priority'] < priority)
+
+    def _can_start(self, lane, ticket):
+        return self._queues[lane][0] == ticket and self._lane_free(lane)
+
+    def acquire(self, lane, client=None, deadline=None, bounded=True):
+        """
+        Waits for a slot in `lane`; `deadline` is a time.monotonic() value.
+        Unbounded waiters (background jobs, which hold no server thread)
+        skip the `max_queued` check and do not count toward it.
+        Returns the seconds spent waiting, or raises RequestShed.
+        """
+        start = time.monotonic()
+        with self._changed:
+            if deadline is not None and start >= deadline:
+                self.shed[lane] += 1
+                raise RequestShed('Request deadline passed before it started.', 'DEADLINE_EXCEEDED', 503)
+            would_wait = bool(self._queues[lane]) or not self._lane_free(lane)
+            if bounded and would_wait and self._bounded_waiting[lane] >= self.lanes[lane]['max_queued']:
+                self.shed[lane] += 1
+                raise RequestShed('Server is busy; too many requests are already queued.', 'LANE_QUEUE_FULL', 503)
+            if client and self.per_client_limit and self._clients.get(client, 0) >= self.per_client_limit:
+                self.shed[lane] += 1
+                raise RequestShed('Too many requests in progress for this client.', 'CLIENT_CONCURRENCY_LIMIT', 429)
+            if client:
+                self._clients[client] = self._clients.get(client, 0) + 1
+
+            ticket = next(self._tickets)
+            queue = self._queues[lane]
+            queue.append(ticket)
+            if bounded:
+                self._bounded_waiting[lane] += 1
+            self._publish(lane)
+            try:
+                while not self._can_start(lane, ticket):
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        self.shed[lane] += 1
+                        self._release_client(client)
+                        raise RequestShed('Request deadline passed while it was queued.', 'DEADLINE_EXCEEDED', 503)
+                    self._changed.wait(timeout)
+            finally:
+                queue.remove(ticket)
+                if bounded:
+                    self._bounded_waiting[lane] -= 1
+                self._changed.notify_all()  # the next ticket, or lower lanes, may start now
+                self._publish(lane)
+            self.running[lane] += 1
+            self._publish(lane)
+        return time.monotonic() - start
+
+    def release(self, lane, client=None):
+        with self._changed:
+            self.running[lane] -= 1
+            self._release_client(client)
+            self._publish(lane)
+            self._changed.notify_all()
+
+    def _publish(self, lane):
+        if self.gauge is not None:
+            self.gauge.set(len(self._queues[lane]), lane=lane, state='waiting')
+            self.gauge.set(self.running[lane], lane=lane, state='running')
+
+    def _release_client(self, client):
+        if client:
+            self._clients[client] -= 1
+            if not self._clients[client]:
+                del self._clients[client]
+
+    def status(self):
+        with self._changed:
+            return {name: {'priority': config['priority'], 'concurrency': config['concurrency'],
+                           'max_queued': config['max_queued'],
+                           'running': self.running[name], 'waiting': len(self._queues[name]),
+                           'shed': self.shed[name]}
+                    for name, config in self.lanes.items()}
@@ -45,7 +45,7 @@ interface PredictionResponse {
   }
 }
 
-async function getModelPrediction(features: AudioFeatures): Promise<PredictionResponse> {
+async function getModelPrediction(features: AudioFeatures, clientId?: string): Promise<PredictionResponse> {
   try {
     // Map the JS features to the order expected by the Python model.
     // This is a simplified mapping. A real implementation would need to ensure all 15 features are present.
@@ -67,9 +67,12 @@ async function getModelPrediction(features: AudioFeatures): Promise<PredictionRe
       0.2                        // PPE - Simulated default
     ];
 
+    // Node's fetch pools keep-alive connections, and the model server speaks
+    // HTTP/1.1, so repeated predictions reuse the same socket.
     const response = await fetch('http://127.0.0.1:5001/predict', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      // X-Client-Id lets the server's per-client limit tell users behind this proxy apart
+      headers: { 'Content-Type': 'application/json', ...(clientId ? { 'X-Client-Id': clientId } : {}) },
       body: JSON.stringify({ features: orderedFeatures }),
     });
 
@@ -120,7 +123,8 @@ export async function POST(request: NextRequest) {
     }
     
     // Get prediction from our Python model server
-    const result = await getModelPrediction(body.features)
+    const clientId = request.headers.get('x-forwarded-for')?.split(',')[0].trim() || undefined
+    const result = await getModelPrediction(body.features, clientId)
     
     // Add timestamp and metadata
     const response = {
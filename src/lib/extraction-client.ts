@@ -0,0 +1,120 @@
+import http from 'http'
+
+// Client for the Python model server's /extract endpoint. Connections are
+// kept alive and pooled, and the body is raw PCM, so the CPU-heavy DSP runs
+// in Python and never blocks Node's event loop.
+//
+// EXTRACTION_SOCKET=/tmp/parkinsons.sock talks to a server started with
+// UNIX_SOCKET; otherwise MODEL_SERVER_HOST/MODEL_SERVER_PORT (127.0.0.1:5001).
+const socketPath = process.env.EXTRACTION_SOCKET
+const host = process.env.MODEL_SERVER_HOST || '127.0.0.1'
+const port = Number(process.env.MODEL_SERVER_PORT || 5001)
+
+const agent = new http.Agent({
+  keepAlive: true,
+  maxSockets: Number(process.env.EXTRACTION_POOL_SIZE || 8),
+})
+
+export interface PCMAudio {
+  pcm: Buffer
+  sampleRate: number
+  channels: number
+  format: 's16le' | 'f32le'
+}
+
+export interface ExtractionResult {
+  prediction: number
+  confidence: number
+  model_version: string
+  model_tier: 'full' | 'distilled'
+  features: Record<string, number>
+  display_features: {
+    pitch_std: number
+    mfccs: number[]
+    zcr: number
+    spectral_centroid: number
+  }
+  ood: { score: number; threshold: number; out_of_distribution: boolean } | null
+  quality_report: { warnings: string[]; quality_score: number; snr: number; amplitude: number }
+  audio_seconds: { analyzed_seconds: number; voiced_seconds: number }
+  timings: { queue_ms: number; extraction_ms: number; predict_ms: number; server_ms: number }
+}
+
+export class ExtractionError extends Error {
+  constructor(message: string, public status: number, public code?: string) {
+    super(message)
+  }
+}
+
+// Parses a PCM WAV file. Anything else is treated as headerless 16-bit mono
+// at 22050 Hz, which is what the recorder uploaded before.
+export function parseWav(buffer: Buffer): PCMAudio {
+  if (buffer.length < 12 || buffer.toString('ascii', 0, 4) !== 'RIFF' || buffer.toString('ascii', 8, 12) !== 'WAVE') {
+    return { pcm: buffer.subarray(0, buffer.length - (buffer.length % 2)), sampleRate: 22050, channels: 1, format: 's16le' }
+  }
+
+  let sampleRate = 22050
+  let channels = 1
+  let format: 's16le' | 'f32le' = 's16le'
+  let offset = 12
+  while (offset + 8 <= buffer.length) {
+    const chunkId = buffer.toString('ascii', offset, offset + 4)
+    const chunkSize = buffer.readUInt32LE(offset + 4)
+    const body = offset + 8
+    if (chunkId === 'fmt ') {
+      const audioFormat = buffer.readUInt16LE(body)
+      channels = buffer.readUInt16LE(body + 2)
+      sampleRate = buffer.readUInt32LE(body + 4)
+      const bitsPerSample = buffer.readUInt16LE(body + 14)
+      if (audioFormat === 3 && bitsPerSample === 32) format = 'f32le'
+      else if (bitsPerSample !== 16) throw new ExtractionError('Unsupported WAV encoding. Use 16-bit PCM or 32-bit float.', 400)
+    } else if (chunkId === 'data') {
+      const end = Math.min(body + chunkSize, buffer.length)
+      return { pcm: buffer.subarray(body, end), sampleRate, channels, format }
+    }
+    offset = body + chunkSize + (chunkSize % 2)
+  }
+  throw new ExtractionError('WAV file has no audio data.', 400)
+}
+
+// The timeout doubles as the request's deadline (X-Deadline-Ms), so the server
+// sheds the work instead of running it after we have given up. clientId
+// (X-Client-Id) is what the server's per-client concurrency limit counts by.
+export function extractAndPredict(audio: PCMAudio, timeoutMs = 120000, clientId?: string): Promise<ExtractionResult> {
+  return new Promise((resolve, reject) => {
+    const req = http.request({
+      agent,
+      ...(socketPath ? { socketPath } : { host, port }),
+      method: 'POST',
+      path: '/extract',
+      timeout: timeoutMs,
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        'Content-Length': audio.pcm.length,
+        'X-Sample-Rate': String(audio.sampleRate),
+        'X-Channels': String(audio.channels),
+        'X-Sample-Format': audio.format,
+        'X-Deadline-Ms': String(timeoutMs),
+        ...(clientId ? { 'X-Client-Id': clientId } : {}),
+      },
+    }, (res) => {
+      const chunks: Buffer[] = []
+      res.on('data', (chunk: Buffer) => chunks.push(chunk))
+      res.on('end', () => {
+        try {
+          const body = JSON.parse(Buffer.concat(chunks).toString('utf8'))
+          if (res.statusCode === 200) {
+            resolve(body as ExtractionResult)
+          } else {
+            reject(new ExtractionError(body.error?.message || 'Extraction failed', res.statusCode || 500, body.error?.code))
+          }
+        } catch (error) {
+          reject(error)
+        }
+      })
+    })
+    req.on('timeout', () => req.destroy(new ExtractionError('Extraction service timed out', 504)))
+    req.on('error', reject)
+    req.end(audio.pcm)
+  })
+}
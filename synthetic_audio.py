@@ -0,0 +1,48 @@
+import io
+import wave
+import numpy as np
+
+def generate_sustained_vowel(duration, sr=22050, f0=140.0, jitter=0.005, shimmer=0.03,
+                             snr_db=30.0, silence=0.5, seed=0):
+    """
+    Synthesizes a sustained vowel cycle by cycle, so jitter (relative period
+    perturbation) and shimmer (relative amplitude perturbation) behave like
+    the MDVP measures. Adds white noise at `snr_db` and `silence` seconds of
+    near-silence before and after the phonation. Returns float32 samples.
+    """
+    rng = np.random.default_rng(seed)
+    n_voiced = int(duration * sr)
+
+    # Per-cycle periods and amplitudes, then expanded to a per-sample phase
+    n_cycles = int(duration * f0 * 1.2) + 2
+    periods = (sr / f0) * (1 + jitter * rng.standard_normal(n_cycles))
+    amplitudes = 1 + shimmer * rng.standard_normal(n_cycles)
+    boundaries = np.concatenate([[0], np.cumsum(periods)])
+    sample_idx = np.arange(n_voiced)
+    cycle = np.minimum(np.searchsorted(boundaries, sample_idx, side='right') - 1, n_cycles - 1)
+    phase = 2 * np.pi * (cycle + (sample_idx - boundaries[cycle]) / periods[cycle])
+
+    # Glottal-like harmonic series with 1/k roll-off
+    voiced = np.zeros(n_voiced)
+    for k in range(1, 9):
+        voiced += np.sin(k * phase) / k
+    voiced *= amplitudes[cycle]
+    voiced *= 0.3 / np.max(np.abs(voiced))
+
+    signal_power = np.mean(voiced ** 2)
+    noise_power = signal_power / (10 ** (snr_db / 10))
+    pad = np.zeros(int(silence * sr))
+    y = np.concatenate([pad, voiced, pad])
+    y += np.sqrt(noise_power) * rng.standard_normal(len(y))
+    return y.astype(np.float32)
+
+def to_wav_bytes(y, sr=22050):
+    """Encodes float samples in [-1, 1] as 16-bit mono PCM WAV bytes."""
+    pcm = (np.clip(y, -1, 1) * 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
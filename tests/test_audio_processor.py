@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+import audio_processor
+from audio_processor import analyze_audio_quality
+from synthetic_audio import generate_sustained_vowel
+
+SR = 22050
+
+@pytest.mark.parametrize('duration, snr_db', [(5, 50), (60, 40), (120, 50)])
+def test_snr_float32_matches_float64(duration, snr_db):
+    y = generate_sustained_vowel(duration, SR, snr_db=snr_db)
+    report32 = analyze_audio_quality(y.astype(np.float32), SR)
+    report64 = analyze_audio_quality(y.astype(np.float64), SR)
+    assert report32['snr_measured'] and report64['snr_measured']
+    assert report32['snr'] == pytest.approx(report64['snr'], abs=0.1)
+
+def test_work_buffer_is_reused_up_to_the_cap():
+    small = audio_processor._work_buffer('test', (1000,), np.float32)
+    assert audio_processor._work_buffer('test', (500,), np.float32).base is small.base
+
+    count = audio_processor.WORK_BUFFER_MAX_BYTES // 4 + 1
+    large = audio_processor._work_buffer('test', (count,), np.float32)
+    assert large.size == count
+    assert audio_processor._buffers.test.size == 1000  # the oversized array is not kept
@@ -0,0 +1,82 @@
+import os
+
+try:
+    from threadpoolctl import threadpool_limits
+    THREADPOOLCTL_AVAILABLE = True
+except ImportError:
+    THREADPOOLCTL_AVAILABLE = False
+
+# Read by OpenMP, the BLAS libraries and numexpr when they initialize
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+class ThreadBudget:
+    """
+    Splits a machine-wide core budget between server worker processes and the
+    requests each worker runs concurrently, so native libraries do not
+    oversubscribe the CPU.
+
+    Each worker gets cores // workers cores. Every concurrent request (an
+    extraction slot) gets an equal share of those for BLAS/OpenMP, and model
+    inference gets `inference_threads` (1 by default: single-row trees finish
+    before extra threads pay for their wake-up).
+    """
+
+    def __init__(self, cores=None, workers=1, concurrency=1, inference_threads=None):
+        self.cores = int(cores or available_cores())
+        self.workers = max(1, int(workers))
+        self.concurrency = max(1, int(concurrency))
+        self.worker_cores = max(1, self.cores // self.workers)
+        self.library_threads = max(1, self.worker_cores // self.concurrency)
+        self.inference_threads = max(1, int(inference_threads or 1))
+        self._limiter = None
+
+    @classmethod
+    def from_env(cls, concurrency=1):
+        """
+        CPU_BUDGET (default: available cores), SERVER_WORKERS (processes sharing
+        the budget, default 1) and INFERENCE_THREADS (default 1).
+        """
+        return cls(cores=os.environ.get('CPU_BUDGET') or None,
+                   workers=os.environ.get('SERVER_WORKERS', 1),
+                   concurrency=concurrency,
+                   inference_threads=os.environ.get('INFERENCE_THREADS') or None)
+
+    def apply(self):
+        """
+        Limits OpenMP/BLAS threads in this process. Environment variables cover
+        libraries loaded later; threadpoolctl resizes the ones already loaded.
+        """
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(self.library_threads)
+        if THREADPOOLCTL_AVAILABLE:
+            self._limiter = threadpool_limits(limits=self.library_threads)
+        return self
+
+    def configure_model(self, model, threads=None):
+        """Resets n_jobs/nthread saved with the model (-1 = every core) to the inference budget."""
+        threads = threads or self.inference_threads
+        if hasattr(model, 'get_booster'):
+            model.set_params(n_jobs=threads)
+            model.get_booster().set_param({'nthread': threads})
+        elif hasattr(model, 'n_jobs'):
+            model.set_params(n_jobs=threads)
+        return model
+
+    def describe(self):
+        return {
+            'cores': self.cores,
+            'workers': self.workers,
+            'concurrency': self.concurrency,
+            'worker_cores': self.worker_cores,
+            'library_threads': self.library_threads,
+            'inference_threads': self.inference_threads,
+            'threadpoolctl': THREADPOOLCTL_AVAILABLE
+        }
@@ -15,6 +15,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeRegressor
 from xgboost import XGBClassifier
 from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold, cross_val_score
 from sklearn.preprocessing import StandardScaler
@@ -23,14 +24,19 @@ from sklearn.metrics import (
     roc_auc_score, classification_report, confusion_matrix
 )
 from sklearn.impute import SimpleImputer
+from scipy.stats import chi2
 from imblearn.over_sampling import SMOTE
 import joblib
 import warnings
 import urllib.request
 import zipfile
 import os
+import copy
+import argparse
 import shap
 from pathlib import Path
+from tree_ensemble import FlatEnsemble
+from distilled_model import DistilledModel
 
 # Suppress warnings for cleaner output
 warnings.filterwarnings('ignore')
@@ -38,6 +44,27 @@ warnings.filterwarnings('ignore')
 # Set random seeds for reproducibility
 np.random.seed(42)
 
+# The 15 voice features the served model expects, in model input order
+VOICE_FEATURES = [
+    'MDVP:Fo(Hz)',      # Fundamental frequency
+    'MDVP:Fhi(Hz)',      # Maximum fundamental frequency  
+    'MDVP:Flo(Hz)',      # Minimum fundamental frequency
+    'MDVP:Jitter(%)',    # Jitter
+    'MDVP:Jitter(Abs)',   # Absolute jitter
+    'MDVP:Shimmer',      # Shimmer
+    'MDVP:Shimmer(dB)',  # Shimmer in dB
+    'NHR',              # Harmonics-to-noise ratio
+    'HNR',              # Harmonics-to-noise ratio
+    'RPDE',             # Recurrence period density entropy
+    'DFA',              # Detrended fluctuation analysis
+    'spread1', 'spread2', # Pitch variation measures
+    'D2',               # Pitch variation measure
+    'PPE'               # Pitch period entropy
+]
+
+# Computed by the server's cascade first stage without pyin or HPSS
+CASCADE_FEATURES = VOICE_FEATURES[:7]
+
 class ParkinsonsTrainer:
     """
     A comprehensive trainer for Parkinson's disease detection using voice features.
@@ -48,6 +75,7 @@ class ParkinsonsTrainer:
         self.dataset2_url = "https://archive.ics.uci.edu/ml/machine-learning-databases/parkinsons/telemonitoring/parkinsons_updrs.data"
         self.model_path = "parkinsons_model.pkl"
         self.scaler_path = "feature_scaler.pkl"
+        self.artifacts_dir = "models"
         
     def download_dataset(self, url, filename):
         """
@@ -129,22 +157,7 @@ class ParkinsonsTrainer:
                 df_processed = df_processed.drop('name', axis=1)
 
             # Extract relevant voice features
-            voice_features = [
-                'MDVP:Fo(Hz)',      # Fundamental frequency
-                'MDVP:Fhi(Hz)',      # Maximum fundamental frequency  
-                'MDVP:Flo(Hz)',      # Minimum fundamental frequency
-                'MDVP:Jitter(%)',    # Jitter
-                'MDVP:Jitter(Abs)',   # Absolute jitter
-                'MDVP:Shimmer',      # Shimmer
-                'MDVP:Shimmer(dB)',  # Shimmer in dB
-                'NHR',              # Harmonics-to-noise ratio
-                'HNR',              # Harmonics-to-noise ratio
-                'RPDE',             # Recurrence period density entropy
-                'DFA',              # Detrended fluctuation analysis
-                'spread1', 'spread2', # Pitch variation measures
-                'D2',               # Pitch variation measure
-                'PPE'               # Pitch period entropy
-            ]
+            voice_features = VOICE_FEATURES
             
             # Select only available columns
             available_features = [col for col in voice_features if col in df_processed.columns]
@@ -448,19 +461,21 @@ class ParkinsonsTrainer:
         
         return cv_scores
     
-    def save_model(self, model, scaler, model_name, metrics):
+    def save_model(self, model, scaler, model_name, metrics, output_dir=".", extra_metadata=None):
         """
         Save the trained model and scaler.
         """
         print(f"\nSaving {model_name} model...")
+        model_path = os.path.join(output_dir, self.model_path)
+        scaler_path = os.path.join(output_dir, self.scaler_path)
         
         # Save the model
-        joblib.dump(model, self.model_path, compress=3)
-        print(f"Model saved as: {self.model_path}")
+        joblib.dump(model, model_path, compress=3)
+        print(f"Model saved as: {model_path}")
         
         # Save the scaler
-        joblib.dump(scaler, self.scaler_path, compress=3)
-        print(f"Scaler saved as: {self.scaler_path}")
+        joblib.dump(scaler, scaler_path, compress=3)
+        print(f"Scaler saved as: {scaler_path}")
         
         # Save model metadata
         metadata = {
@@ -469,28 +484,120 @@ class ParkinsonsTrainer:
             'training_date': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
             'performance_metrics': {k: v for k, v in metrics.items() if k != 'feature_importance'}
         }
+        if extra_metadata:
+            metadata.update(extra_metadata)
         
-        metadata_path = f"{model_name.lower()}_metadata.pkl"
+        metadata_path = os.path.join(output_dir, f"{model_name.lower()}_metadata.pkl")
         joblib.dump(metadata, metadata_path)
         print(f"Metadata saved as: {metadata_path}")
 
-    def save_explainer_and_stats(self, model, X_train_scaled, feature_names):
+    def export_flat_ensemble(self, model, scaler, X_check_scaled, output_dir="."):
+        """
+        Flattens the ensemble into parkinsons_model.npz for NumPy-only serving,
+        after checking it bit for bit against the model on `X_check_scaled`
+        plus random probe rows. The export is skipped if any output differs.
+        """
+        print("\nExporting flattened tree ensemble...")
+        ensemble = FlatEnsemble.from_model(model, scaler)
+        probes = np.random.default_rng(0).standard_normal((2000, X_check_scaled.shape[1])) * 2
+        mismatched, max_difference = ensemble.verify(model, np.vstack([X_check_scaled, probes]))
+        if mismatched:
+            print(f"⚠️ Flattened ensemble differs from the model on {mismatched} rows; not exported")
+            return None
+        path = os.path.join(output_dir, 'parkinsons_model.npz')
+        ensemble.save(path)
+        print(f"Flattened ensemble ({len(ensemble.roots)} trees, {len(ensemble.feature)} nodes, "
+              f"max probability difference {max_difference:.1e}) saved as: {path}")
+        return path
+
+    def train_distilled_model(self, teacher, X_train_scaled, y_train, X_test_scaled, y_test,
+                              output_dir=".", max_depth=5, augment_factor=5):
+        """
+        Distills the ensemble into one shallow regression tree for the
+        server's low-latency fallback tier. SMOTE grows each training class
+        `augment_factor` times so the tree is fitted to the ensemble's
+        probabilities between the real samples, not just on them.
+        """
+        print("\nDistilling fallback model from the ensemble...")
+        counts = pd.Series(y_train).value_counts()
+        smote = SMOTE(sampling_strategy={label: int(count * augment_factor) for label, count in counts.items()},
+                      random_state=42)
+        X_augmented, _ = smote.fit_resample(X_train_scaled, y_train)
+        soft_labels = teacher.predict_proba(X_augmented)[:, 1]
+        
+        student = DecisionTreeRegressor(max_depth=max_depth, random_state=42)
+        student.fit(X_augmented, soft_labels)
+        
+        distilled = DistilledModel.from_tree(student)
+        distilled.agreement = float(np.mean(distilled.predict(X_test_scaled) == teacher.predict(X_test_scaled)))
+        distilled.accuracy = float(accuracy_score(y_test, distilled.predict(X_test_scaled)))
+        path = distilled.save(output_dir)
+        print(f"Distilled model (depth {distilled.max_depth}) trained on {len(X_augmented)} augmented rows: "
+              f"accuracy {distilled.accuracy:.4f}, agrees with the ensemble on {distilled.agreement:.1%} of test rows")
+        print(f"Distilled model saved as: {path}")
+        return distilled
+
+    def train_cascade_model(self, scaler, X_train_scaled, y_train, X_test_scaled, y_test,
+                            output_dir=".", thresholds=(0.8, 0.9, 0.95)):
+        """
+        Trains the small first-stage model of the server's cascade mode on the
+        cheap features only (CASCADE_FEATURES) and exports it as
+        cascade_model.npz with their scaler parameters. Prints, per confidence
+        threshold, the share of test rows it would answer and its accuracy on
+        them, for choosing CASCADE_CONFIDENCE.
+        """
+        print("\nTraining cascade first-stage model on cheap features...")
+        columns = [VOICE_FEATURES.index(name) for name in CASCADE_FEATURES]
+        model = XGBClassifier(n_estimators=30, max_depth=3, learning_rate=0.3,
+                              random_state=42, n_jobs=-1, eval_metric='logloss')
+        model.fit(X_train_scaled[:, columns], y_train)
+        
+        ensemble = FlatEnsemble.from_model(model)
+        ensemble.scaler_mean = scaler.mean_[columns]
+        ensemble.scaler_scale = scaler.scale_[columns]
+        ensemble.feature_names = CASCADE_FEATURES
+        
+        probabilities = ensemble.predict_proba(X_test_scaled[:, columns])
+        predictions = probabilities.argmax(axis=1)
+        confidence = probabilities.max(axis=1)
+        y_test = np.asarray(y_test)
+        print(f"Cascade model accuracy on all test rows: {accuracy_score(y_test, predictions):.4f}")
+        for threshold in thresholds:
+            answered = confidence >= threshold
+            accuracy = accuracy_score(y_test[answered], predictions[answered]) if answered.any() else float('nan')
+            print(f"  CASCADE_CONFIDENCE={threshold}: answers {answered.mean():.0%} of rows, accuracy {accuracy:.4f}")
+        
+        path = os.path.join(output_dir, 'cascade_model.npz')
+        ensemble.save(path)
+        print(f"Cascade model saved as: {path}")
+        return ensemble
+
+    def save_explainer_and_stats(self, model, X_train_scaled, feature_names, output_dir="."):
         """Saves SHAP explainer and training data statistics."""
         print("\nCreating and saving SHAP explainer...")
         explainer = shap.TreeExplainer(model)
-        joblib.dump(explainer, 'shap_explainer.pkl')
+        joblib.dump(explainer, os.path.join(output_dir, 'shap_explainer.pkl'))
         print("SHAP explainer saved as: shap_explainer.pkl")
 
         print("Saving training data stats for explanations...")
         training_stats = {'mean': np.mean(X_train_scaled, axis=0), 'std': np.std(X_train_scaled, axis=0), 'columns': feature_names}
-        joblib.dump(training_stats, 'training_stats.pkl')
+        joblib.dump(training_stats, os.path.join(output_dir, 'training_stats.pkl'))
         print("Training stats saved as: training_stats.pkl")
 
-    def save_ood_stats(self, X_train_scaled):
+    def save_ood_stats(self, X_train_scaled, output_dir="."):
         print("\nCalculating and saving statistics for OOD detection...")
         train_mean = np.mean(X_train_scaled, axis=0)
-        joblib.dump(train_mean, 'training_data_mean.pkl')
+        joblib.dump(train_mean, os.path.join(output_dir, 'training_data_mean.pkl'))
         print("OOD stats (mean) saved as: training_data_mean.pkl")
+
+        # Mahalanobis distance with a precomputed inverse covariance; the
+        # threshold is the 99th percentile of the training rows' own distances.
+        inv_cov = np.linalg.pinv(np.cov(X_train_scaled, rowvar=False))
+        diff = X_train_scaled - train_mean
+        distances = np.sqrt(np.einsum('ij,jk,ik->i', diff, inv_cov, diff))
+        ood_stats = {'mean': train_mean, 'inv_cov': inv_cov, 'threshold': float(np.percentile(distances, 99))}
+        joblib.dump(ood_stats, os.path.join(output_dir, 'ood_stats.pkl'))
+        print(f"OOD stats (Mahalanobis, threshold {ood_stats['threshold']:.2f}) saved as: ood_stats.pkl")
     
     def generate_final_report(self, rf_metrics, xgb_metrics):
         """
@@ -602,6 +709,9 @@ class ParkinsonsTrainer:
                 best_model = rf_model
                 self.save_model(best_model, scaler, "RandomForest", rf_metrics)
                 self.save_explainer_and_stats(best_model, X_train_scaled, feature_names)
+            self.export_flat_ensemble(best_model, scaler, np.vstack([X_train_scaled, X_test_scaled]))
+            self.train_distilled_model(best_model, X_train_scaled, y_train, X_test_scaled, y_test)
+            self.train_cascade_model(scaler, X_train_scaled, y_train, X_test_scaled, y_test)
             
             # Generate final report
             self.generate_final_report(rf_metrics, xgb_metrics)
@@ -614,12 +724,190 @@ class ParkinsonsTrainer:
         else:
             print("❌ No valid dataset loaded. Exiting.")
 
+    def iter_feature_batches(self, sources, batch_size=1000):
+        """
+        Stream (X, y) mini-batches from chunked CSV files or from iterables of
+        DataFrames (e.g. stored production feature extractions).
+        """
+        for source in sources:
+            if isinstance(source, (str, Path)):
+                chunks = pd.read_csv(source, chunksize=batch_size)
+            else:
+                chunks = source
+            for chunk in chunks:
+                missing = [col for col in VOICE_FEATURES + ['status'] if col not in chunk.columns]
+                if missing:
+                    raise ValueError(f"Feature batch is missing columns: {missing}")
+                chunk = chunk.dropna(subset=['status'])
+                if len(chunk) > 0:
+                    yield chunk[VOICE_FEATURES].astype(float), chunk['status'].astype(int)
+
+    def _two_class_batches(self, batches, max_pending_rows):
+        """
+        Merge consecutive batches until both classes are present. Neither
+        XGBoost continuation nor a warm-started forest accepts a single-class fit.
+        """
+        pending_X, pending_y, pending_rows = [], [], 0
+        for X, y in batches:
+            pending_X.append(X)
+            pending_y.append(y)
+            pending_rows += len(y)
+            y_all = pd.concat(pending_y, ignore_index=True)
+            if y_all.nunique() >= 2:
+                yield pd.concat(pending_X, ignore_index=True), y_all
+                pending_X, pending_y, pending_rows = [], [], 0
+            elif pending_rows > max_pending_rows:
+                print(f"Skipping {pending_rows} rows: no second class within {max_pending_rows} rows.")
+                pending_X, pending_y, pending_rows = [], [], 0
+        if pending_rows:
+            print(f"Skipping {pending_rows} trailing rows with a single class.")
+
+    def run_incremental_training(self, sources, batch_size=1000, rounds_per_batch=10,
+                                 trees_per_batch=10, update_scaler=True, promote=False):
+        """
+        Continue training the current model on new feature rows, one mini-batch
+        at a time, and write the result as a new versioned artifact.
+
+        Pass 1 updates the scaler's running mean/variance; pass 2 adds boosting
+        rounds (XGBoost) or trees (Random Forest) per batch. Updating the scaler
+        slightly shifts the inputs earlier trees see; the new rounds absorb
+        this, and a periodic full retrain resets it. SMOTE needs the whole
+        dataset in memory and is not applied here.
+        """
+        print("🔁 Starting incremental training")
+        print("=" * 80)
+        
+        base_dir = self.active_version_dir()
+        print(f"Continuing from: {base_dir}")
+        model = joblib.load(os.path.join(base_dir, self.model_path))
+        scaler = copy.deepcopy(joblib.load(os.path.join(base_dir, self.scaler_path)))
+        is_xgboost = isinstance(model, XGBClassifier)
+        sources = list(sources)
+        
+        # Pass 1: streaming mean/variance update of the scaler
+        if update_scaler:
+            print("\nUpdating scaler statistics...")
+            for X, _ in self.iter_feature_batches(sources, batch_size):
+                scaler.partial_fit(X)
+            print(f"Scaler statistics now cover {int(np.max(scaler.n_samples_seen_))} samples")
+        
+        # Pass 2: continue the model batch by batch
+        print("\nContinuing model training...")
+        fill_values = pd.Series(scaler.mean_, index=VOICE_FEATURES)
+        n_rows = 0
+        n_correct = 0
+        feature_sum = np.zeros(len(VOICE_FEATURES))
+        feature_cross_sum = np.zeros((len(VOICE_FEATURES), len(VOICE_FEATURES)))
+        
+        batches = self._two_class_batches(self.iter_feature_batches(sources, batch_size), 10 * batch_size)
+        for X, y in batches:
+            X_scaled = scaler.transform(X.fillna(fill_values))
+            
+            # Test-then-train: score each batch before the model has seen it
+            n_correct += int(np.sum(model.predict(X_scaled) == y.values))
+            n_rows += len(y)
+            feature_sum += X_scaled.sum(axis=0)
+            feature_cross_sum += X_scaled.T @ X_scaled
+            
+            if is_xgboost:
+                model.set_params(n_estimators=rounds_per_batch)
+                model.fit(X_scaled, y, xgb_model=model.get_booster())
+            else:
+                model.set_params(warm_start=True, n_estimators=model.n_estimators + trees_per_batch)
+                model.fit(X_scaled, y)
+            print(f"Trained on {n_rows} rows (progressive accuracy: {n_correct / n_rows:.4f})")
+        
+        if n_rows == 0:
+            print("❌ No usable feature rows found. Model left unchanged.")
+            return None
+        
+        if is_xgboost:
+            model.set_params(n_estimators=model.get_booster().num_boosted_rounds())
+        
+        # Write a new versioned artifact
+        version = pd.Timestamp.now().strftime('v%Y%m%d-%H%M%S')
+        output_dir = os.path.join(self.artifacts_dir, version)
+        os.makedirs(output_dir, exist_ok=True)
+        
+        model_name = "XGBoost" if is_xgboost else "RandomForest"
+        metrics = {
+            'accuracy': n_correct / n_rows,
+            'feature_importance': pd.DataFrame({
+                'feature': VOICE_FEATURES,
+                'importance': model.feature_importances_
+            }).sort_values('importance', ascending=False)
+        }
+        extra_metadata = {'version': version, 'training_mode': 'incremental', 'rows_seen': n_rows}
+        
+        feature_mean = feature_sum / n_rows
+        feature_cov = feature_cross_sum / n_rows - np.outer(feature_mean, feature_mean)
+        
+        # Everything goes into the new version's directory; the top-level
+        # 'default' artifacts are never touched, so a failed step here can
+        # not leave the served model half old, half new. The version has no
+        # distilled fallback: distillation needs the SMOTE-augmented full dataset.
+        self.save_model(model, scaler, model_name, metrics, output_dir, extra_metadata)
+        self.save_streaming_stats(feature_mean, feature_cov, output_dir)
+        self.export_flat_ensemble(model, scaler, np.empty((0, len(VOICE_FEATURES))), output_dir)
+        if promote:
+            self.set_active_version(version)
+        
+        print(f"\n✅ Incremental training completed: {n_rows} rows, version {version}")
+        print(f"📁 Artifacts saved in: {output_dir}")
+        return version
+
+    def active_version_dir(self):
+        """Directory of the version named in models/ACTIVE, or '.' for the top-level model files."""
+        try:
+            with open(os.path.join(self.artifacts_dir, 'ACTIVE')) as f:
+                directory = os.path.join(self.artifacts_dir, f.read().strip())
+        except OSError:
+            return "."
+        return directory if os.path.exists(os.path.join(directory, self.model_path)) else "."
+
+    def set_active_version(self, version):
+        """Points models/ACTIVE at `version`; a running model server picks it up without a restart."""
+        active_path = os.path.join(self.artifacts_dir, 'ACTIVE')
+        tmp_path = active_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, active_path)  # atomic, so the server never reads a partial name
+        print(f"Active model version set to: {version}")
+
+    def save_streaming_stats(self, feature_mean, feature_cov, output_dir="."):
+        """Saves explanation and OOD statistics accumulated batch by batch."""
+        feature_std = np.sqrt(np.maximum(np.diag(feature_cov), 0))
+        training_stats = {'mean': feature_mean, 'std': feature_std, 'columns': VOICE_FEATURES}
+        joblib.dump(training_stats, os.path.join(output_dir, 'training_stats.pkl'))
+        joblib.dump(feature_mean, os.path.join(output_dir, 'training_data_mean.pkl'))
+        
+        # No per-row distances are kept, so use the chi-squared 99% quantile
+        ood_stats = {
+            'mean': feature_mean,
+            'inv_cov': np.linalg.pinv(feature_cov),
+            'threshold': float(np.sqrt(chi2.ppf(0.99, df=len(feature_mean))))
+        }
+        joblib.dump(ood_stats, os.path.join(output_dir, 'ood_stats.pkl'))
+        print(f"Training and OOD stats saved in: {output_dir}")
+
 def main():
     """
     Main function to run the training pipeline.
     """
+    parser = argparse.ArgumentParser(description="Train the Parkinson's voice classifier.")
+    parser.add_argument('--incremental', nargs='+', metavar='CSV',
+                        help='Continue training the current model on these feature files instead of retraining from scratch')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Rows per mini-batch in incremental mode')
+    parser.add_argument('--promote', action='store_true',
+                        help='Make the new version the served one (models/ACTIVE)')
+    args = parser.parse_args()
+    
     trainer = ParkinsonsTrainer()
-    trainer.run_training_pipeline()
+    if args.incremental:
+        trainer.run_incremental_training(args.incremental, batch_size=args.batch_size, promote=args.promote)
+    else:
+        trainer.run_training_pipeline()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
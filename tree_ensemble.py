@@ -0,0 +1,204 @@
+import json
+import numpy as np
+
+class FlatEnsemble:
+    """
+    A fitted XGBoost (binary:logistic) or scikit-learn random forest
+    flattened into contiguous node arrays, evaluated with NumPy only.
+
+    All trees share one node table. Leaves point to themselves, so every row
+    can take `max_depth` steps through every tree at once without checking
+    which rows have already reached a leaf. Thresholds are compared in
+    float32, as both libraries do, and leaf values are accumulated in tree
+    order, so XGBoost margins and forest probabilities match the original
+    model bit for bit. XGBoost probabilities can differ by one float32 ulp,
+    because NumPy's exp and the C library's expf round differently.
+    """
+
+    def __init__(self, kind, feature, threshold, left, right, default_left, value, roots,
+                 max_depth, base_margin=0.0, scaler_mean=None, scaler_scale=None, feature_names=None):
+        self.kind = kind  # 'xgboost' (split: x < t) or 'forest' (split: x <= t)
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.value = np.ascontiguousarray(value)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.base_margin = np.float32(base_margin)
+        self.scaler_mean = None if scaler_mean is None else np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = None if scaler_scale is None else np.asarray(scaler_scale, dtype=np.float64)
+        self.feature_names = list(feature_names) if feature_names is not None else []
+
+    # --- Export (needs the training libraries) ---
+
+    @classmethod
+    def from_model(cls, model, scaler=None):
+        """Flattens a fitted XGBClassifier or RandomForestClassifier, optionally with its StandardScaler."""
+        if hasattr(model, 'get_booster'):
+            ensemble = cls._from_xgboost(model.get_booster())
+        elif hasattr(model, 'estimators_'):
+            ensemble = cls._from_forest(model)
+        else:
+            raise TypeError(f"Unsupported model type: {type(model).__name__}")
+        if scaler is not None:
+            ensemble.scaler_mean = np.asarray(scaler.mean_, dtype=np.float64)
+            ensemble.scaler_scale = np.asarray(scaler.scale_, dtype=np.float64)
+            ensemble.feature_names = list(getattr(scaler, 'feature_names_in_', []))
+        return ensemble
+
+    @classmethod
+    def _from_xgboost(cls, booster):
+        learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+        if learner['objective']['name'] != 'binary:logistic':
+            raise ValueError(f"Only binary:logistic is supported, not {learner['objective']['name']}")
+        model = learner['gradient_booster']['model']
+
+        # base_score is stored as a probability ('[5E-1]' in newer versions);
+        # the trees add to its logit, computed in float32 like XGBoost does
+        base_score = np.float32(learner['learner_model_param']['base_score'].strip('[]'))
+        base_margin = -np.log(np.float32(1) / base_score - np.float32(1), dtype=np.float32)
+
+        arrays = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'default_left', 'value')}
+        roots, offset, max_depth = [], 0, 0
+        for tree in model['trees']:
+            left = np.asarray(tree['left_children'], dtype=np.int64)
+            right = np.asarray(tree['right_children'], dtype=np.int64)
+            is_leaf = left == -1
+            node_ids = np.arange(len(left))
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            arrays['feature'].append(np.where(is_leaf, 0, tree['split_indices']))
+            arrays['threshold'].append(np.where(is_leaf, 0.0, conditions.astype(np.float64)))
+            arrays['left'].append(np.where(is_leaf, node_ids, left) + offset)
+            arrays['right'].append(np.where(is_leaf, node_ids, right) + offset)
+            arrays['default_left'].append(np.asarray(tree['default_left'], dtype=bool))
+            arrays['value'].append(np.where(is_leaf, conditions, np.float32(0)))  # leaf value lives in split_conditions
+            roots.append(offset)
+            offset += len(left)
+            max_depth = max(max_depth, cls._depth(left, right))
+
+        return cls('xgboost', *(np.concatenate(arrays[name]) for name in
+                                ('feature', 'threshold', 'left', 'right', 'default_left', 'value')),
+                   roots, max_depth, base_margin)
+
+    @classmethod
+    def _from_forest(cls, model):
+        arrays = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'default_left', 'value')}
+        roots, offset, max_depth = [], 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(tree.node_count)
+            # Normalized leaf class distribution, as DecisionTreeClassifier.predict_proba computes it
+            value = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            arrays['feature'].append(np.where(is_leaf, 0, tree.feature))
+            arrays['threshold'].append(np.where(is_leaf, 0.0, tree.threshold))
+            arrays['left'].append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            arrays['right'].append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            arrays['default_left'].append(np.asarray(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count)), dtype=bool))
+            arrays['value'].append(value / normalizer)
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, int(tree.max_depth))
+
+        return cls('forest', *(np.concatenate(arrays[name]) for name in
+                               ('feature', 'threshold', 'left', 'right', 'default_left', 'value')),
+                   roots, max_depth)
+
+    @staticmethod
+    def _depth(left, right):
+        depth, level = 0, np.array([0])
+        while True:
+            children = np.concatenate([left[level], right[level]])
+            children = children[children >= 0]
+            if len(children) == 0:
+                return depth
+            depth, level = depth + 1, children
+
+    # --- Persistence ---
+
+    def save(self, path):
+        np.savez_compressed(path, kind=self.kind, feature=self.feature, threshold=self.threshold, left=self.left,
+                 right=self.right, default_left=self.default_left, value=self.value, roots=self.roots,
+                 max_depth=self.max_depth, base_margin=self.base_margin,
+                 scaler_mean=self.scaler_mean if self.scaler_mean is not None else np.array([]),
+                 scaler_scale=self.scaler_scale if self.scaler_scale is not None else np.array([]),
+                 feature_names=np.array(self.feature_names, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(str(data['kind']), data['feature'], data['threshold'], data['left'], data['right'],
+                       data['default_left'], data['value'], data['roots'], int(data['max_depth']),
+                       data['base_margin'],
+                       data['scaler_mean'] if data['scaler_mean'].size else None,
+                       data['scaler_scale'] if data['scaler_scale'].size else None,
+                       data['feature_names'].tolist())
+
+    # --- Evaluation ---
+
+    def apply(self, X):
+        """Leaf node index reached by every row in every tree, shape (n_trees, n_rows)."""
+        # Both libraries compare float32 features; float64 holds them exactly
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_offsets = np.arange(0, n_rows * n_features, n_features)
+        nodes = np.repeat(self.roots[:, np.newaxis], n_rows, axis=1)
+        has_missing = np.isnan(flat_X).any()
+        for _ in range(self.max_depth):
+            x = flat_X.take(row_offsets + self.feature.take(nodes))
+            threshold = self.threshold.take(nodes)
+            go_left = np.less(x, threshold) if self.kind == 'xgboost' else np.less_equal(x, threshold)
+            if has_missing:
+                go_left |= np.isnan(x) & self.default_left.take(nodes)
+            nodes = np.where(go_left, self.left.take(nodes), self.right.take(nodes))
+        return nodes
+
+    def decision_function(self, X):
+        """XGBoost margin (log-odds) per row, summed tree by tree in float32."""
+        leaves = self.value.take(self.apply(X))
+        terms = np.concatenate([np.full((1, leaves.shape[1]), self.base_margin, dtype=np.float32), leaves])
+        return np.add.reduce(terms, axis=0, dtype=np.float32)  # sequential over axis 0, in tree order
+
+    def predict_proba(self, X_scaled):
+        """Class probabilities for already-scaled rows, shape (n_rows, n_classes)."""
+        X_scaled = np.atleast_2d(X_scaled)
+        if self.kind == 'xgboost':
+            # Sigmoid as XGBoost computes it; exp is rounded from float64 to
+            # match the correctly rounded C expf
+            margin = np.minimum(-self.decision_function(X_scaled), np.float32(88.7))
+            exp_margin = np.exp(margin.astype(np.float64)).astype(np.float32)
+            positive = np.float32(1) / (exp_margin + np.float32(1) + np.float32(1e-16))
+            return np.column_stack([np.float32(1) - positive, positive])
+        leaves = self.value.take(self.apply(X_scaled), axis=0)  # (n_trees, n_rows, n_classes)
+        return np.add.reduce(leaves, axis=0) / len(self.roots)
+
+    def predict(self, X_scaled):
+        return self.predict_proba(X_scaled).argmax(axis=1)
+
+    def scale(self, X):
+        """Applies the exported StandardScaler parameters to raw feature rows."""
+        if self.scaler_mean is None:
+            raise ValueError('This ensemble was exported without scaler parameters')
+        return (np.atleast_2d(np.asarray(X, dtype=np.float64)) - self.scaler_mean) / self.scaler_scale
+
+    def verify(self, model, X_scaled):
+        """
+        Compares against the original model on `X_scaled`. Returns the number
+        of rows whose outputs (XGBoost margins, forest probabilities) differ
+        in any bit, and the largest probability difference.
+        """
+        X_scaled = np.atleast_2d(X_scaled)
+        if self.kind == 'xgboost':
+            import xgboost
+            expected = model.get_booster().predict(xgboost.DMatrix(X_scaled), output_margin=True)
+            mismatched = int(np.count_nonzero(self.decision_function(X_scaled).view(np.int32) != expected.view(np.int32)))
+        else:
+            expected = model.predict_proba(X_scaled)
+            mismatched = int(np.count_nonzero(np.any(self.predict_proba(X_scaled).view(np.int64) != expected.view(np.int64), axis=1)))
+        max_difference = float(np.max(np.abs(self.predict_proba(X_scaled) - model.predict_proba(X_scaled))))
+        return mismatched, max_difference